@@ -3,109 +3,331 @@ from flask import (
     render_template,
     request,
     abort,
-    send_from_directory,
+    send_file,
     url_for,
     make_response,
     flash,
     session,
     redirect,
+    jsonify,
+    g,
+    Response,
+    before_render_template,
+    request_finished,
+    request_started,
+    template_rendered,
 )
+import gzip
+import hashlib
 import json
 import os
 import html as html_module
 import markdown
-from datetime import datetime
+from datetime import datetime, timezone
 import re
-import glob
 import subprocess
 import sys
+import bisect
 import secrets
+import stat as stat_module
+import threading
 import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 from dotenv import load_dotenv
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow миниатюры не делаются, отдаются оригиналы
+    Image = None
+
+import data_store
+import history_store
+import live_channel
+import metrics
+import search_index
+import shared_state
+import sqlite_storage
 
 load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY")
 
+# =========================
+# Метрики (/metrics)
+# =========================
+
+# Каталог, через который воркеры gunicorn складывают метрики (см. metrics.py)
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(app.root_path, "cache", "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+app_metrics = metrics.MetricsRegistry(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+app_metrics.histogram("http_request_duration_seconds", "Время обработки запроса по endpoint")
+app_metrics.counter("http_requests_total", "Запросы по endpoint и коду ответа")
+app_metrics.histogram("template_render_seconds", "Время рендера шаблонов Jinja")
+app_metrics.histogram(
+    "wiki_markdown_render_seconds", "Рендер markdown и таблицы полей страницы вики (промах кэша)"
+)
+app_metrics.counter("cache_requests_total", "Обращения к кэшам: hit или miss")
+app_metrics.counter("data_reloads_total", "Перезагрузки данных с изменениями")
+app_metrics.counter("data_reload_errors_total", "Ошибки при перезагрузке данных")
+
+
+@request_started.connect_via(app)
+def metrics_request_started(sender, **extra):
+    g.metrics_started = time.perf_counter()
+
+
+@request_finished.connect_via(app)
+def metrics_request_finished(sender, response, **extra):
+    started = g.get("metrics_started")
+    if started is None:
+        return
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    app_metrics.observe(
+        "http_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint
+    )
+    app_metrics.inc("http_requests_total", endpoint=endpoint, status=response.status_code)
+    app_metrics.maybe_flush()
+
+
+@before_render_template.connect_via(app)
+def metrics_template_started(sender, template, context, **extra):
+    g.setdefault("metrics_templates", []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def metrics_template_rendered(sender, template, context, **extra):
+    starts = g.get("metrics_templates")
+    if starts:
+        app_metrics.observe(
+            "template_render_seconds",
+            time.perf_counter() - starts.pop(),
+            template=template.name or "string",
+        )
+
+
+def count_cache(name, hit):
+    app_metrics.inc("cache_requests_total", cache=name, result="hit" if hit else "miss")
+
+
 # =========================
 # Sitemap.xml
 # =========================
 
 
-@app.route("/sitemap.xml")
-def sitemap():
-    static_pages = [
-        "",
-        "/index",
-        "/wiki",
-        "/servers",
-        "/guides",
-        "/materials",
-        "/info",
-    ]
+# Лимит протокола sitemaps.org на один файл; дальше — индекс из частей
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_AGE = 3600
 
-    urls = set(static_pages)
+STATIC_PAGES = {
+    "": "index.html",
+    "/index": "index.html",
+    "/info": "info.html",
+}
 
-    # ---- Серверы
-    for slug in server_slug_cache.keys():
-        urls.add(f"/server/{slug}")
+# Готовые файлы sitemap по базовому URL сайта. Пересобираются, только
+# когда меняется снимок серверов или версия данных pages_data
+sitemap_cache = {}
+sitemap_lock = threading.Lock()
 
-    for guild_id in servers_data.keys():
-        if guild_id.isdigit():
-            urls.add(f"/server/{guild_id}")
+# (тип, id) → (хэш содержимого, время изменения) для lastmod страниц вики
+wiki_item_mtimes = {}
 
-    # ---- Wiki страницы
-    for item in orgs + persons + events:
-        item_id = item.get("id")
-        name = item.get("name")
 
-        if not item_id:
-            continue
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
 
-        slug = slugify(name) if name else ""
-        urls.add(f"/wiki/{slug or item_id}")
 
-    base_url = request.url_root.rstrip("/")
+def update_wiki_item_mtimes():
+    """
+    lastmod элемента вики: время файла при запуске, а дальше — момент,
+    когда изменилось содержимое именно этой записи
+    """
+    global wiki_item_mtimes
+
+    now = time.time()
+    mtimes = {}
+    for filename, item_type in WIKI_FILES.items():
+        source = {"org": orgs, "person": persons, "event": events}[item_type]
+        default = file_mtime(os.path.join(DATA_FOLDER, filename)) or now
+        for item in source:
+            key = (item_type, str(item.get("id")))
+            digest = hashlib.sha1(
+                json.dumps(item, ensure_ascii=False, sort_keys=True).encode("utf-8")
+            ).digest()
+            previous = wiki_item_mtimes.get(key)
+            if previous is None:
+                mtimes[key] = (digest, default if not wiki_item_mtimes else now)
+            elif previous[0] != digest:
+                mtimes[key] = (digest, now)
+            else:
+                mtimes[key] = previous
+    wiki_item_mtimes = mtimes
 
-    xml = [
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
-    ]
 
-    today = datetime.utcnow().date().isoformat()
+def sitemap_entries(snapshot):
+    """Список (путь, lastmod, changefreq, priority) всех страниц сайта"""
+    entries = {}
+    templates_dir = os.path.join(app.root_path, "templates")
 
-    for url in sorted(urls):
-        full_url = f"{base_url}{url}"
+    for path, template in STATIC_PAGES.items():
+        entries[path] = file_mtime(os.path.join(templates_dir, template))
+
+    # ---- Серверы: время последней записи файла ботом
+    server_mtimes = {
+        guild_id: signature[0] / 1e9
+        for guild_id, signature in servers_file_stats.items()
+    }
+    for slug, guild_id in snapshot.slugs.items():
+        entries[f"/server/{slug}"] = server_mtimes.get(guild_id)
+    for guild_id in snapshot.data.keys():
+        if guild_id.isdigit():
+            entries[f"/server/{guild_id}"] = server_mtimes.get(guild_id)
+    entries["/servers"] = max(server_mtimes.values(), default=None)
 
-        if url == "/info":
-            priority = "1.0"
-            changefreq = "yearly"
-        elif url.startswith("/wiki/"):
-            priority = "0.9"
-            changefreq = "weekly"
+    # ---- Wiki страницы
+    wiki_mtimes = []
+    for item_type, source in (("org", orgs), ("person", persons), ("event", events)):
+        for item in source:
+            item_id = item.get("id")
+            if not item_id:
+                continue
+            slug = slugify(item.get("name")) if item.get("name") else ""
+            mtime = wiki_item_mtimes.get((item_type, str(item_id)), (None, None))[1]
+            entries[f"/wiki/{slug or item_id}"] = mtime
+            wiki_mtimes.append(mtime or 0)
+    entries["/wiki"] = max(wiki_mtimes, default=None)
+
+    for path, filename in (("/guides", "guides.json"), ("/materials", "materials.json")):
+        entries[path] = file_mtime(os.path.join(DATA_FOLDER, filename))
+
+    result = []
+    for path in sorted(entries):
+        if path == "/info":
+            changefreq, priority = "yearly", "1.0"
+        elif path.startswith("/wiki/"):
+            changefreq, priority = "weekly", "0.9"
         else:
-            priority = "0.6"
-            changefreq = "daily"
-
-        xml.extend(
-            [
-                "  <url>",
-                f"    <loc>{full_url}</loc>",
-                f"    <lastmod>{today}</lastmod>",
-                f"    <changefreq>{changefreq}</changefreq>",
-                f"    <priority>{priority}</priority>",
-                "  </url>",
-            ]
-        )
+            changefreq, priority = "daily", "0.6"
+        result.append((path, entries[path], changefreq, priority))
+    return result
+
+
+def lastmod_date(mtime):
+    return datetime.fromtimestamp(mtime, timezone.utc).date().isoformat()
+
+
+def sitemap_file(body):
+    """Готовый ответ: тело, его gzip-версия и ETag"""
+    data = body.encode("utf-8")
+    return data, gzip.compress(data, 9, mtime=0), hashlib.sha1(data).hexdigest()
+
+
+def build_sitemap_files(base_url, entries):
+    """sitemap.xml, а если URL больше лимита — индекс и части sitemap-N.xml"""
+    chunks = [
+        entries[i : i + SITEMAP_MAX_URLS]
+        for i in range(0, len(entries), SITEMAP_MAX_URLS)
+    ] or [[]]
+
+    files = {}
+    for number, chunk in enumerate(chunks, 1):
+        xml = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+        ]
+        for path, mtime, changefreq, priority in chunk:
+            xml.append("  <url>")
+            xml.append(
+                f"    <loc>{html_module.escape(base_url + quote(path))}</loc>"
+            )
+            if mtime:
+                xml.append(f"    <lastmod>{lastmod_date(mtime)}</lastmod>")
+            xml.append(f"    <changefreq>{changefreq}</changefreq>")
+            xml.append(f"    <priority>{priority}</priority>")
+            xml.append("  </url>")
+        xml.append("</urlset>")
+        name = "sitemap.xml" if len(chunks) == 1 else f"sitemap-{number}.xml"
+        files[name] = sitemap_file("\n".join(xml))
+
+    if len(chunks) > 1:
+        xml = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+        ]
+        for number, chunk in enumerate(chunks, 1):
+            mtimes = [mtime for _, mtime, _, _ in chunk if mtime]
+            xml.append("  <sitemap>")
+            xml.append(f"    <loc>{base_url}/sitemap-{number}.xml</loc>")
+            if mtimes:
+                xml.append(f"    <lastmod>{lastmod_date(max(mtimes))}</lastmod>")
+            xml.append("  </sitemap>")
+        xml.append("</sitemapindex>")
+        files["sitemap.xml"] = sitemap_file("\n".join(xml))
+
+    return files
+
+
+def get_sitemap_files():
+    base_url = request.url_root.rstrip("/")
+    # Снимок серверов заменяется целиком (copy-on-write), поэтому его
+    # сравниваем по идентичности, а не по содержимому
+    snapshot = servers_snapshot
+    pages_version = pages_store.snapshot().version
+
+    cached = sitemap_cache.get(base_url)
+    if cached is not None and cached[0] is snapshot and cached[1] == pages_version:
+        count_cache("sitemap", True)
+        return cached[2]
+
+    count_cache("sitemap", False)
+    with sitemap_lock:
+        cached = sitemap_cache.get(base_url)
+        if cached is not None and cached[0] is snapshot and cached[1] == pages_version:
+            return cached[2]
+        files = build_sitemap_files(base_url, sitemap_entries(snapshot))
+        # Базовых адресов немного (домен, IP); чужой Host не раздувает кэш
+        if len(sitemap_cache) >= 4:
+            sitemap_cache.clear()
+        sitemap_cache[base_url] = (snapshot, pages_version, files)
+        return files
+
+
+def send_sitemap(name):
+    files = get_sitemap_files()
+    if name not in files:
+        abort(404)
+    data, gzipped, etag = files[name]
 
-    xml.append("</urlset>")
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    response = make_response(gzipped if use_gzip else data)
+    response.headers["Content-Type"] = "application/xml; charset=utf-8"
+    response.headers["Vary"] = "Accept-Encoding"
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag + ("-gz" if use_gzip else ""))
+    response.cache_control.public = True
+    response.cache_control.max_age = SITEMAP_MAX_AGE
+    return response.make_conditional(request)
 
-    response = make_response("\n".join(xml))
-    response.headers["Content-Type"] = "application/xml"
-    return response
+
+@app.route("/sitemap.xml")
+def sitemap():
+    return send_sitemap("sitemap.xml")
+
+
+@app.route("/sitemap-<int:number>.xml")
+def sitemap_part(number):
+    return send_sitemap(f"sitemap-{number}.xml")
 
 
-def generate_server_slug(name, guild_id):
+def generate_server_slug(name, guild_id, slug_cache):
     """Генерирует slug из названия. Если не уникально — возвращает ID"""
     if not name:
         return str(guild_id)
@@ -118,8 +340,8 @@ def generate_server_slug(name, guild_id):
         return str(guild_id)
 
     # Если slug свободен — используем его
-    if slug not in server_slug_cache:
-        server_slug_cache[slug] = guild_id
+    if slug not in slug_cache:
+        slug_cache[slug] = guild_id
         return slug
     else:
         # Если занят — fallback на ID
@@ -127,87 +349,639 @@ def generate_server_slug(name, guild_id):
 
 
 # Путь к папке с данными серверов (JSON)
-SERVERS_DATA_DIR = os.path.join(app.root_path, "servers")
+SERVERS_DATA_DIR = os.getenv("SERVERS_DATA_DIR", os.path.join(app.root_path, "servers"))
 
 # Путь к папке с аватарками и баннерами (куда бот сохраняет)
-ASSETS_DIR = os.path.join(app.root_path, "servers", "assets")
+ASSETS_DIR = os.path.join(SERVERS_DATA_DIR, "assets")
 
-# Глобальная переменная для данных серверов
-servers_data = {}
+# Бинарная история серверов (см. history_store.py)
+SERVERS_HISTORY_DIR = os.path.join(SERVERS_DATA_DIR, "history")
 
+# Как часто воркер проверяет servers/*.json на изменения (0 — не проверять)
+SERVERS_RELOAD_INTERVAL = float(os.getenv("SERVERS_RELOAD_INTERVAL", "30"))
+
+
+class LRUCache:
+    """
+    Потокобезопасный кэш ограниченного размера с вытеснением по LRU.
+    С name попадания и промахи считаются в метрике cache_requests_total
+    """
+
+    def __init__(self, maxsize, name=None):
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+        if self.name:
+            count_cache(self.name, value is not None)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Необязательное SQLite-хранилище вместо JSON-файлов (STORAGE_BACKEND=sqlite)
+storage = sqlite_storage.Storage() if sqlite_storage.enabled() else None
+
+# Снимок данных серверов: guild_id → {"info": ...} и slug → guild_id.
+# Подменяется целиком одним присваиванием, поэтому запрос никогда
+# не увидит наполовину собранный словарь. Остальные секции документа
+# (участники, пересечения, старая история) читаются по требованию —
+# см. server_section
+ServersSnapshot = namedtuple("ServersSnapshot", ["data", "slugs"])
+servers_snapshot = ServersSnapshot({}, {})
+
+# guild_id → сигнатура последней успешно прочитанной версии (см. scan_servers)
+servers_file_stats = {}
+servers_reload_lock = threading.Lock()
+
+
+def build_server_slugs(data):
+    """Строит кэш slug → guild_id (при конфликте сервер доступен только по ID)"""
+    slug_cache = {}
+    for guild_id in sorted(data):
+        info = data[guild_id].get("info", {}) or {}
+        name = info.get("name") or f"Server {guild_id}"
+        generate_server_slug(name, guild_id, slug_cache)
+    return slug_cache
+
+
+def scan_servers():
+    """guild_id → сигнатура версии: (mtime_ns, size) файла или (updated_ns, version) в базе"""
+    if storage is not None:
+        return storage.guild_versions()
+
+    signatures = {}
+    for entry in os.scandir(SERVERS_DATA_DIR):
+        if not entry.name.endswith(".json") or not entry.is_file():
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        signatures[entry.name[: -len(".json")]] = (st.st_mtime_ns, st.st_size)
+    return signatures
+
+
+# Разбор JSON серверов по секциям: в памяти остаются только нужные ключи
+# верхнего уровня. Ненужные (например, тысячи участников) декодируются
+# C-парсером и сразу отбрасываются, а после последнего нужного ключа
+# разбор прекращается
+json_decoder = json.JSONDecoder()
+JSON_SEPARATORS_RE = re.compile(r"[\s,:]*")
+
+# Бот пишет "info" и "member_overlaps" перед "members", поэтому для списка
+# серверов и страницы сервера обычно хватает начала файла
+SERVER_PREFIX_CHARS = 64 * 1024
+
+# Сколько прочитанных секций (участники, пересечения) держать в памяти
+SERVER_SECTIONS_CACHE_SIZE = int(os.getenv("SERVER_SECTIONS_CACHE_SIZE", "32"))
+server_sections_cache = LRUCache(SERVER_SECTIONS_CACHE_SIZE, "server_sections")
+
+
+def parse_json_sections(text, keys):
+    """Значения ключей keys из JSON-объекта верхнего уровня"""
+    result = {}
+    pos = JSON_SEPARATORS_RE.match(text, 0).end()
+    if text[pos] != "{":
+        raise ValueError("Ожидался JSON-объект")
+    pos += 1
+    while len(result) < len(keys):
+        pos = JSON_SEPARATORS_RE.match(text, pos).end()
+        if text[pos] == "}":
+            break
+        key, pos = json_decoder.raw_decode(text, pos)
+        pos = JSON_SEPARATORS_RE.match(text, pos).end()
+        value, pos = json_decoder.raw_decode(text, pos)
+        if key in keys:
+            result[key] = value
+    return result
+
+
+def read_json_sections(path, keys, prefix=None):
+    """
+    Читает секции keys из JSON-файла. С prefix сначала пробует разобрать
+    только первые prefix символов и дочитывает файл, если их не хватило
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if prefix is not None:
+            text = f.read(prefix)
+            try:
+                result = parse_json_sections(text, keys)
+                if len(result) == len(keys):
+                    return result
+            except (ValueError, IndexError):
+                pass
+            text += f.read()
+        else:
+            text = f.read()
+    try:
+        return parse_json_sections(text, keys)
+    except IndexError:
+        raise ValueError(f"Обрезанный JSON: {path}")
 
-def load_servers_data():
-    """Загружает все JSON-файлы серверов и генерирует slug-кэш"""
-    global servers_data, server_slug_cache
 
-    servers_data = {}
-    server_slug_cache = {}
+def read_server(guild_id):
+    """Только секция info сервера — её хватает для списка и slug"""
+    if storage is not None:
+        info = storage.load_guild_info(guild_id)
+        return None if info is None else {"info": info}
+    path = os.path.join(SERVERS_DATA_DIR, f"{guild_id}.json")
+    return {"info": read_json_sections(path, {"info"}, SERVER_PREFIX_CHARS).get("info") or {}}
+
+
+def server_section(guild_id, section):
+    """
+    Секция документа сервера ("member_overlaps", "members" или старая
+    "history"), прочитанная при первом обращении. Кэш привязан к версии
+    файла, поэтому после записи ботом секция перечитается
+    """
+    key = (guild_id, section, servers_file_stats.get(guild_id))
+    value = server_sections_cache.get(key)
+    if value is not None:
+        return value
+
+    try:
+        if storage is not None:
+            value = storage.load_guild_section(guild_id, section)
+        else:
+            path = os.path.join(SERVERS_DATA_DIR, f"{guild_id}.json")
+            value = read_json_sections(path, {section}, SERVER_PREFIX_CHARS).get(section)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения {section} сервера {guild_id}: {e}")
+        value = None
+
+    if value is None:
+        value = {} if section == "member_overlaps" else []
+    server_sections_cache.set(key, value)
+    return value
+
+
+def load_servers_data():
+    """
+    Перечитывает изменившиеся серверы (по mtime и размеру файла или по
+    версии в базе) и атомарно подменяет снимок. Возвращает True, если
+    данные изменились
+    """
+    global servers_snapshot, servers_file_stats
 
-    json_files = glob.glob(os.path.join(SERVERS_DATA_DIR, "*.json"))
+    with servers_reload_lock:
+        data = dict(servers_snapshot.data)
+        stats = {}
+        changed = False
 
-    for file_path in json_files:
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            signatures = scan_servers()
+        except Exception as e:
+            print(f"Ошибка чтения списка серверов: {e}")
+            app_metrics.inc("data_reload_errors_total", source="servers")
+            return False
 
-            guild_id = os.path.basename(file_path).replace(".json", "")
-            info = data.get("info", {}) or {}
-            name = info.get("name") or f"Server {guild_id}"
+        for guild_id, signature in signatures.items():
+            if servers_file_stats.get(guild_id) == signature and guild_id in data:
+                stats[guild_id] = signature
+                continue
+
+            try:
+                document = read_server(guild_id)
+            except Exception as e:
+                # Оставляем прежнюю версию, попробуем снова на следующей проверке
+                print(f"Ошибка загрузки сервера {guild_id}: {e}")
+                app_metrics.inc("data_reload_errors_total", source="servers")
+                continue
+            if document is None:
+                continue
+            data[guild_id] = document
 
-            # Генерируем slug (если конфликт — вернётся ID)
-            slug = generate_server_slug(name, guild_id)
-            server_slug_cache[slug] = guild_id
+            stats[guild_id] = signature
+            changed = True
+            name = (data[guild_id].get("info", {}) or {}).get("name")
+            print(f"Загружен сервер: {name or guild_id}")
 
-            servers_data[guild_id] = data
+        for guild_id in set(data) - set(signatures):
+            del data[guild_id]
+            changed = True
 
-            print(f"Загружен сервер: {name} → /server/{slug}")
+        servers_file_stats = stats
+        if changed:
+            servers_snapshot = ServersSnapshot(data, build_server_slugs(data))
+            app_metrics.inc("data_reloads_total", source="servers")
 
+        return changed
+
+
+def servers_reloader_loop():
+    """
+    Фоновый поток: периодически подхватывает изменения от бота
+    и правки pages_data, сделанные на диске в обход админки
+    """
+    while True:
+        time.sleep(SERVERS_RELOAD_INTERVAL)
+        try:
+            load_servers_data()
         except Exception as e:
-            print(f"Ошибка загрузки {file_path}: {e}")
+            print(f"Ошибка перезагрузки серверов: {e}")
+        try:
+            pages_store.reload_changed()
+        except Exception as e:
+            print(f"Ошибка перезагрузки pages_data: {e}")
+
+
+# PID процесса, в котором запущен фоновый поток. Каждый воркер gunicorn
+# (в том числе форкнутый после --preload) запускает свой поток
+servers_reloader_pid = None
+
+
+def start_servers_reloader():
+    """Запускает фоновую перезагрузку серверов в текущем процессе (один раз)"""
+    global servers_reloader_pid
+
+    if SERVERS_RELOAD_INTERVAL <= 0 or servers_reloader_pid == os.getpid():
+        return
+    servers_reloader_pid = os.getpid()
+    threading.Thread(
+        target=servers_reloader_loop, name="servers-reloader", daemon=True
+    ).start()
+
+
+@app.before_request
+def ensure_servers_reloader():
+    start_servers_reloader()
+
+
+# Живые счётчики от бота (см. live_channel.py). Представление своё
+# у каждого воркера; пока бот не подключён, оно пустое
+LIVE_SOCKET_PATH = os.getenv(
+    "LIVE_SOCKET_PATH", os.path.join(app.root_path, "cache", "live.sock")
+)
+live_view = live_channel.LiveView(LIVE_SOCKET_PATH)
+
+
+@app.before_request
+def ensure_live_view():
+    live_view.start()
 
 
 # Загружаем при старте
 load_servers_data()
 
 # Путь к данным вики
-DATA_FOLDER = os.path.join(app.root_path, "pages_data")
-DATA_PAGES_DIR = os.path.join(app.root_path, "pages_data")
+DATA_FOLDER = os.getenv("PAGES_DATA_DIR", os.path.join(app.root_path, "pages_data"))
+DATA_PAGES_DIR = DATA_FOLDER
 
 
-def load_json(filename):
-    filepath = os.path.join(DATA_FOLDER, filename)
-    if not os.path.exists(filepath):
-        print(f"Warning: Файл {filepath} не найден!")
-        return []
-    with open(filepath, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Нижняя граница слайдера участников, даже если в данных меньше
+MAX_MEMBERS_FLOOR = 935
+YOUTUBE_ID_RE = re.compile(r"(?:v=|\/)([0-9A-Za-z_-]{11})")
+
+
+def derive_organizations(items):
+    members = []
+    for org in items:
+        try:
+            members.append(int(org.get("peak_members", 0) or 0))
+        except (TypeError, ValueError):
+            continue
+    return {"max_members": max([MAX_MEMBERS_FLOOR] + members)}
+
+
+def derive_guides(items):
+    """Карточки /guides: превью YouTube или картинки из static/img/guides"""
+    guides_list = []
+    for guide in items:
+        title = guide.get("title", "Без названия")
+        source = guide.get("source", "")
+        guide_type = guide.get("type", "image")  # image или youtube
+
+        if guide_type == "youtube":
+            match = YOUTUBE_ID_RE.search(source)
+            if not match:
+                continue
+            preview_url = f"https://img.youtube.com/vi/{match.group(1)}/hqdefault.jpg"
+            link = source
+        else:  # image
+            preview_url = f"{app.static_url_path}/img/guides/{quote(source)}"
+            link = preview_url  # Клик открывает изображение
+
+        guides_list.append({"title": title, "preview_url": preview_url, "link": link})
+    return {"guides": guides_list}
+
+
+def derive_materials(items):
+    """Карточки /materials и список тегов для фильтра"""
+    materials_list = []
+    all_tags = set()
+    for mat in items:
+        image = mat.get("image", "")
+        tag = mat.get("tag", "Без категории")  # Теперь один тег — поле "tag"
+        all_tags.add(tag)
+        if image:
+            materials_list.append(
+                {
+                    "title": mat.get("title", "Без названия"),
+                    "preview_url": f"{app.static_url_path}/img/materials/{quote(image)}",
+                    "tag": tag,
+                }
+            )
+    # Добавляем "Все" в начало
+    return {
+        "materials": materials_list,
+        "tags": ["Все"] + sorted(all_tags - {"Все"}),
+    }
+
+
+# Все файлы pages_data читаются один раз; изменения из админки и с диска
+# публикуются новыми снимками (см. data_store.py)
+pages_store = data_store.DataStore(
+    sqlite_storage.SqlitePagesSource(storage)
+    if storage is not None
+    else data_store.JsonDirSource(DATA_FOLDER),
+    derivers={
+        "organizations.json": derive_organizations,
+        "guides.json": derive_guides,
+        "materials.json": derive_materials,
+    },
+)
+
+orgs = pages_store.get("organizations.json")
+persons = pages_store.get("personalities.json")
+events = pages_store.get("events.json")
+
+# Общее состояние воркеров gunicorn: поколение pages_data и сессии админки
+SHARED_STATE_PATH = os.getenv(
+    "SHARED_STATE_PATH", os.path.join(app.root_path, "cache", "shared_state.sqlite3")
+)
+PAGES_GENERATION = "pages_data"
+shared_store = shared_state.SharedState(SHARED_STATE_PATH)
+pages_generation = shared_store.generation(PAGES_GENERATION)
+
+
+@app.before_request
+def sync_pages_data():
+    """Подхватывает правки pages_data, сделанные другим воркером"""
+    global pages_generation
 
+    generation = shared_store.generation(PAGES_GENERATION)
+    if generation != pages_generation:
+        pages_generation = generation
+        pages_store.reload_changed()
 
-orgs = load_json("organizations.json")
-persons = load_json("personalities.json")
-events = load_json("events.json")
+
+def update_pages_data(filename, mutate):
+    """Запись в pages_data через хранилище с оповещением остальных воркеров"""
+    result = pages_store.update(filename, mutate)
+    shared_store.bump(PAGES_GENERATION)
+    return result
+
+
+# =========================
+# Отдача файлов с ETag и кэшированием
+# =========================
+
+# Файлы с хэшем в имени (<id>_icon_<hash>.png) никогда не меняются по тому же адресу
+HASHED_ASSET_RE = re.compile(r"^\d+_(icon|banner)_(a_)?[0-9a-f]+\.png$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STATIC_MAX_AGE = 3600
+
+# путь → (mtime_ns, size, etag). Хэш содержимого считается один раз на версию файла
+file_etag_cache = {}
+
+
+def file_etag(path, st):
+    """ETag по содержимому файла, кэшируется до изменения mtime/размера"""
+    cached = file_etag_cache.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+    file_etag_cache[path] = (st.st_mtime_ns, st.st_size, etag)
+    return etag
+
+
+def send_cached_file(directory, filename, max_age, immutable=False):
+    """
+    Отдаёт файл с ETag по содержимому и Cache-Control; на If-None-Match
+    отвечает 304. Файл передаётся через wsgi.file_wrapper (sendfile у gunicorn)
+    """
+    path = safe_join(directory, filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not stat_module.S_ISREG(st.st_mode):
+        abort(404)
+
+    response = send_file(
+        path,
+        etag=file_etag(path, st),
+        last_modified=st.st_mtime,
+        max_age=max_age,
+        conditional=True,
+    )
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
 
 
-# === ИСПРАВЛЕННЫЙ МАРШРУТ ДЛЯ ИКОНОК ===
 @app.route("/servers/assets/<path:filename>")
 def server_assets(filename):
     """
-    Отдаёт аватарки и баннеры из servers/assets/
-    Теперь путь /servers/assets/1119578507287220324_icon.png работает!
+    Отдаёт аватарки и баннеры из servers/assets/.
+    Файлы с хэшем в имени кэшируются браузером навсегда
     """
-    return send_from_directory(ASSETS_DIR, filename)
+    if HASHED_ASSET_RE.match(filename):
+        return send_cached_file(ASSETS_DIR, filename, IMMUTABLE_MAX_AGE, immutable=True)
+    return send_cached_file(ASSETS_DIR, filename, STATIC_MAX_AGE)
+
+
+# =========================
+# Миниатюры изображений (WebP нужной ширины)
+# =========================
 
+THUMB_WIDTHS = (160, 320, 640, 1280)
+THUMB_SOURCES = {
+    "static": app.static_folder,
+    "assets": ASSETS_DIR,
+}
+THUMB_ORIGINAL_URLS = {
+    "static": "/static/",
+    "assets": "/servers/assets/",
+}
+THUMB_CACHE_DIR = os.getenv(
+    "THUMB_CACHE_DIR", os.path.join(app.root_path, "cache", "thumbs")
+)
+THUMB_CACHE_MAX_BYTES = int(os.getenv("THUMB_CACHE_MAX_MB", "200")) * 1024 * 1024
+THUMB_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+thumb_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("THUMB_WORKERS", "2")), thread_name_prefix="thumbs"
+)
+# Имя файла миниатюры → Future генерации, чтобы одну картинку не делать дважды
+thumb_jobs = {}
+thumb_jobs_lock = threading.Lock()
+
+
+@app.template_global()
+def thumb_url(source, filename, width):
+    """URL миниатюры; filename — путь внутри static/ или servers/assets/"""
+    return f"/thumbs/{source}/{width}/{quote(filename)}"
+
+
+@app.template_global()
+def thumb_srcset(source, filename, widths=(160, 320)):
+    return ", ".join(f"{thumb_url(source, filename, w)} {w}w" for w in widths)
+
+
+# Размер кэша миниатюр считается по мере записи. Каталог обходится целиком,
+# только когда оценка превысила лимит или устарела: в кэш пишут и другие
+# воркеры, а их миниатюры эта оценка не видит
+THUMB_RESCAN_SECONDS = 300
+thumb_cache_size = None
+thumb_cache_scanned = 0.0
+thumb_cache_lock = threading.Lock()
+
+
+def note_thumb_written(size):
+    """Учитывает новую миниатюру; при необходимости чистит кэш"""
+    global thumb_cache_size
+    with thumb_cache_lock:
+        if (
+            thumb_cache_size is not None
+            and time.monotonic() - thumb_cache_scanned < THUMB_RESCAN_SECONDS
+        ):
+            thumb_cache_size += size
+            if thumb_cache_size <= THUMB_CACHE_MAX_BYTES:
+                return
+        trim_thumb_cache()
+
+
+def trim_thumb_cache():
+    """Пересчитывает размер кэша и удаляет давно не использованные миниатюры,
+    если он превысил лимит (вызывается под thumb_cache_lock)"""
+    global thumb_cache_size, thumb_cache_scanned
+    try:
+        entries = [e for e in os.scandir(THUMB_CACHE_DIR) if e.name.endswith(".webp")]
+    except OSError:
+        return
+    stats = []
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            continue  # удалил другой воркер
+        stats.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in stats)
+    thumb_cache_scanned = time.monotonic()
+
+    if total > THUMB_CACHE_MAX_BYTES:
+        # mtime обновляется при обращении (см. thumbnail) — это и есть LRU
+        for _, size, path in sorted(stats):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= THUMB_CACHE_MAX_BYTES * 0.9:
+                break
+    thumb_cache_size = total
+
+
+def generate_thumbnail(src_path, dst_path, width):
+    """Уменьшает изображение до ширины width и сохраняет в WebP (в пуле потоков)"""
+    with Image.open(src_path) as img:
+        img.seek(0)  # у анимированных GIF/WebP берём первый кадр
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+
+        os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{dst_path}.{threading.get_ident()}.tmp"
+        img.save(tmp_path, "WEBP", quality=80, method=4)
+    os.replace(tmp_path, dst_path)
+    note_thumb_written(os.path.getsize(dst_path))
+
+
+@app.route("/thumbs/<source>/<int:width>/<path:filename>")
+def thumbnail(source, width, filename):
+    """Отдаёт уменьшенную WebP-копию изображения; генерирует её один раз"""
+    directory = THUMB_SOURCES.get(source)
+    if directory is None or width not in THUMB_WIDTHS:
+        abort(404)
+    if os.path.splitext(filename)[1].lower() not in THUMB_EXTENSIONS:
+        abort(404)
+
+    src_path = safe_join(directory, filename)
+    if src_path is None:
+        abort(404)
+    try:
+        src_stat = os.stat(src_path)
+    except OSError:
+        abort(404)
+
+    if Image is None:
+        return redirect(THUMB_ORIGINAL_URLS[source] + quote(filename))
+
+    key = f"{source}/{filename}:{src_stat.st_mtime_ns}:{width}"
+    thumb_name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".webp"
+    thumb_path = os.path.join(THUMB_CACHE_DIR, thumb_name)
 
-# Границы слайдеров
+    try:
+        thumb_stat = os.stat(thumb_path)
+    except OSError:
+        thumb_stat = None
+
+    count_cache("thumbnails", thumb_stat is not None)
+    if thumb_stat is None:
+        with thumb_jobs_lock:
+            job = thumb_jobs.get(thumb_name)
+            if job is None:
+                job = thumb_executor.submit(generate_thumbnail, src_path, thumb_path, width)
+                thumb_jobs[thumb_name] = job
+        try:
+            job.result(timeout=30)
+        except Exception as e:
+            print(f"Ошибка миниатюры {source}/{filename}: {e}")
+            return redirect(THUMB_ORIGINAL_URLS[source] + quote(filename))
+        finally:
+            with thumb_jobs_lock:
+                thumb_jobs.pop(thumb_name, None)
+    elif time.time() - thumb_stat.st_mtime > 3600:
+        # Отмечаем использование для LRU (не чаще раза в час)
+        os.utime(thumb_path)
+
+    # Иконка с хэшем в имени не меняется, а ширина входит в URL —
+    # такую миниатюру, как и оригинал, браузер кэширует навсегда
+    if source == "assets" and HASHED_ASSET_RE.match(filename):
+        return send_cached_file(THUMB_CACHE_DIR, thumb_name, IMMUTABLE_MAX_AGE, immutable=True)
+    return send_cached_file(THUMB_CACHE_DIR, thumb_name, STATIC_MAX_AGE)
+
+
+# Границы слайдеров (верхняя граница участников — из derive_organizations)
 MIN_YEAR = 2017
 MAX_YEAR = 2025
-try:
-    max_members = max(
-        int(org.get("peak_members", 0) or 0) for org in orgs if org.get("peak_members")
-    )
-    MAX_MEMBERS = max(max_members, 935)
-except:
-    MAX_MEMBERS = 935
 
 
 def slugify(text):
@@ -221,23 +995,324 @@ def slugify(text):
     return text.strip("-")
 
 
+# Индекс вики: id и slug → (элемент, тип). Строится один раз и
+# пересобирается при сохранении в админ-панели
+WIKI_FILES = {
+    "organizations.json": "org",
+    "personalities.json": "person",
+    "events.json": "event",
+}
+wiki_index = {}
+
+
+# Кэш отрендеренных фрагментов /wiki/<slug>: (тип, id, версия данных) → фрагменты
+WIKI_RENDER_CACHE_SIZE = int(os.getenv("WIKI_RENDER_CACHE_SIZE", "256"))
+wiki_render_cache = LRUCache(WIKI_RENDER_CACHE_SIZE, "wiki_render")
+wiki_data_version = 0
+
+
+def build_wiki_index():
+    """Строит индекс id/slug → (элемент, тип) и сообщает о конфликтах slug"""
+    global wiki_index
+
+    index = {}
+    owners = {}  # ключ → (тип, id) владельца, для сообщений о конфликтах
+
+    for item_type, source in (("org", orgs), ("person", persons), ("event", events)):
+        for item in source:
+            item_id = item.get("id")
+            if item_id is None:
+                continue
+            item_id = str(item_id)
+            keys = [item_id]
+            name_slug = slugify(item.get("name", ""))
+            if name_slug and name_slug != item_id:
+                keys.append(name_slug)
+
+            for key in keys:
+                if key in index:
+                    # Побеждает первый элемент — как и при линейном поиске
+                    if index[key][0] is not item:
+                        owner_type, owner_id = owners[key]
+                        print(
+                            f"Конфликт slug '{key}': {item_type}/{item_id} "
+                            f"перекрыт {owner_type}/{owner_id}"
+                        )
+                    continue
+                index[key] = (item, item_type)
+                owners[key] = (item_type, item_id)
+
+    wiki_index = index
+
+
+def reload_wiki_data(snapshot):
+    """Берёт данные вики из снимка хранилища, пересобирает индексы и сбрасывает кэш страниц"""
+    global orgs, persons, events, wiki_data_version
+
+    orgs = snapshot.files.get("organizations.json", ())
+    persons = snapshot.files.get("personalities.json", ())
+    events = snapshot.files.get("events.json", ())
+    build_wiki_index()
+
+    # Версия входит в ключ кэша — старые страницы больше не будут найдены
+    wiki_data_version += 1
+    wiki_render_cache.clear()
+    build_wiki_catalog()
+    sync_wiki_search()
+    update_wiki_item_mtimes()
+
+
 def find_item_by_slug_or_id(query):
     """Ищет элемент по slug (из name) или по id"""
-    all_data = [("org", orgs), ("person", persons), ("event", events)]
-    for item_type, source in all_data:
+    return wiki_index.get(query, (None, None))
+
+
+# =========================
+# Каталог вики для /api/wiki: фильтры, сортировка, пагинация
+# =========================
+
+# Поля элемента, нужные карточке в списке (без тяжёлого описания)
+WIKI_CARD_FIELDS = (
+    "id",
+    "name",
+    "leader",
+    "created",
+    "closed",
+    "departed",
+    "date",
+    "peak_members",
+    "reason_for_closing",
+    "old_nicknames",
+    "event_type",
+)
+WIKI_SORTS = ("default", "name", "year", "members")
+WIKI_PAGE_SIZE = 30
+WIKI_MAX_PAGE_SIZE = 100
+NOT_CLOSED = "NOT_CLOSED"
+
+YEAR_RE = re.compile(r"\b(\d{4})\b")
+
+
+def parse_year(value):
+    """Первый четырёхзначный год в строке (как parseDateParts в wiki.html)"""
+    match = YEAR_RE.search(str(value)) if value else None
+    return int(match.group(1)) if match else None
+
+
+def parse_members(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def item_date_range(item, item_type):
+    if item_type == "org":
+        return item.get("created"), item.get("closed")
+    if item_type == "person":
+        return item.get("created"), item.get("departed")
+    return item.get("date"), item.get("date")
+
+
+class WikiTypeCatalog:
+    """
+    Предвычисленные индексы одного типа вики: по годам начала/конца,
+    по числу участников, по значениям фасетов и готовые порядки сортировки.
+    Записи адресуются позицией в исходном списке
+    """
+
+    def __init__(self, item_type, items):
+        self.cards = []
+        self.search_text = []
+        self.facets = {"leader": {}, "reason": {}, "event_type": {}}
+        start_years = []
+        end_years = []
+        members = []
+        no_start = set()
+        no_end = set()
+
+        for pos, item in enumerate(items):
+            self.cards.append({k: item[k] for k in WIKI_CARD_FIELDS if k in item})
+
+            old = item.get("old_nicknames") or ""
+            if isinstance(old, list):
+                old = " ".join(map(str, old))
+            self.search_text.append(
+                " ".join(
+                    [str(item.get("name") or ""), str(item.get("id") or ""), str(old)]
+                ).lower()
+            )
+
+            start, end = item_date_range(item, item_type)
+            start_year, end_year = parse_year(start), parse_year(end)
+            if start_year is None:
+                no_start.add(pos)
+            else:
+                start_years.append((start_year, pos))
+            if end_year is None:
+                no_end.add(pos)
+            else:
+                end_years.append((end_year, pos))
+            members.append((parse_members(item.get("peak_members")), pos))
+
+            if item_type == "org":
+                leaders = item.get("leader") or []
+                if not isinstance(leaders, list):
+                    leaders = [leaders]
+                for leader in leaders:
+                    self.facets["leader"].setdefault(str(leader), set()).add(pos)
+
+                # Та же логика, что была в wiki.html: null/null — «не закрыт»
+                if (
+                    "closed" in item
+                    and item["closed"] is None
+                    and "reason_for_closing" in item
+                    and item["reason_for_closing"] is None
+                ):
+                    reason = NOT_CLOSED
+                else:
+                    reason = str(item.get("reason_for_closing") or "")
+                self.facets["reason"].setdefault(reason, set()).add(pos)
+
+            if item_type == "event":
+                event_type = str(item.get("event_type") or "").strip()
+                self.facets["event_type"].setdefault(event_type, set()).add(pos)
+
+        self.size = len(items)
+        self.start_years = sorted(start_years)
+        self.end_years = sorted(end_years)
+        self.members = sorted(members)
+        self.no_start = no_start
+        self.no_end = no_end
+
+        year_key = {pos: year for year, pos in start_years}
+        self.orders = {
+            "default": list(range(self.size)),
+            "name": sorted(
+                range(self.size),
+                key=lambda p: str(self.cards[p].get("name") or "").lower(),
+            ),
+            "year": sorted(range(self.size), key=lambda p: year_key.get(p, 10**4)),
+            "members": [pos for _, pos in self.members],
+        }
+
+    def _range(self, pairs, low, high):
+        """Позиции, у которых значение в [low, high] (бинарный поиск)"""
+        lo = bisect.bisect_left(pairs, (low, -1)) if low is not None else 0
+        hi = bisect.bisect_right(pairs, (high, self.size)) if high is not None else len(pairs)
+        return {pos for _, pos in pairs[lo:hi]}
+
+    def query(self, text="", year_from=None, year_to=None, members_from=None,
+              members_to=None, facets=None, sort="default", descending=False):
+        """Список позиций, прошедших все фильтры, в нужном порядке"""
+        matched = None
+
+        def narrow(positions):
+            nonlocal matched
+            matched = positions if matched is None else matched & positions
+
+        # Как в wiki.html: конец раньше начала периода или начало позже конца — мимо
+        if year_from is not None:
+            narrow(self._range(self.end_years, year_from, None) | self.no_end)
+        if year_to is not None:
+            narrow(self._range(self.start_years, None, year_to) | self.no_start)
+        if members_from is not None or members_to is not None:
+            narrow(self._range(self.members, members_from, members_to))
+        for name, values in (facets or {}).items():
+            index = self.facets.get(name, {})
+            narrow(set().union(*(index.get(v, set()) for v in values)))
+
+        order = self.orders.get(sort, self.orders["default"])
+        if descending:
+            order = order[::-1]
+        text = text.lower()
+        return [
+            pos
+            for pos in order
+            if (matched is None or pos in matched)
+            and (not text or text in self.search_text[pos])
+        ]
+
+
+# Каталог пересобирается вместе с индексом при каждом изменении данных.
+# Версия каталога — хэш его содержимого: у воркеров gunicorn с одинаковыми
+# данными она совпадает, как бы ни расходились их счётчики перезагрузок
+wiki_catalog = {}
+wiki_catalog_version = ""
+
+
+def build_wiki_catalog():
+    global wiki_catalog, wiki_catalog_version
+
+    wiki_catalog = {
+        "org": WikiTypeCatalog("org", orgs),
+        "person": WikiTypeCatalog("person", persons),
+        "event": WikiTypeCatalog("event", events),
+    }
+    content = json.dumps([orgs, persons, events], ensure_ascii=False, sort_keys=True)
+    wiki_catalog_version = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def wiki_facet_options():
+    """Значения для выпадающих фильтров на странице /wiki"""
+    return {
+        "leader": sorted(wiki_catalog["org"].facets["leader"]),
+        "reason": sorted(r for r in wiki_catalog["org"].facets["reason"] if r),
+        "event_type": sorted(e for e in wiki_catalog["event"].facets["event_type"] if e),
+    }
+
+
+# =========================
+# Полнотекстовый поиск /search
+# =========================
+
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+wiki_search = search_index.SearchIndex()
+
+
+def sync_wiki_search():
+    """Обновляет поисковый индекс: переиндексируются только изменённые записи"""
+    documents = {}
+    for item_type, source in (("org", orgs), ("person", persons), ("event", events)):
         for item in source:
-            if str(item.get("id")) == query:
-                return item, item_type
-            name_slug = slugify(item.get("name", ""))
-            if name_slug == query:
-                return item, item_type
-    return None, None
+            item_id = item.get("id")
+            if item_id is None:
+                continue
+            item_id = str(item_id)
+            fields = {
+                field: item.get(field) for field in search_index.FIELD_WEIGHTS
+            }
+            meta = {
+                "type": item_type,
+                "id": item_id,
+                "name": item.get("name") or item_id,
+                "url": f"/wiki/{quote(item_id)}",
+            }
+            documents[(item_type, item_id)] = (fields, meta)
+    return wiki_search.sync(documents)
+
+
+def on_pages_data_change(snapshot, changed):
+    app_metrics.inc("data_reloads_total", source="pages_data")
+    if changed & set(WIKI_FILES):
+        reload_wiki_data(snapshot)
+
+
+reload_wiki_data(pages_store.snapshot())
+pages_store.subscribe(on_pages_data_change)
+
+
+# Кэш галерей: (тип, id) → (mtime папки, список изображений).
+# mtime каталога меняется при добавлении, удалении и переименовании файлов
+GALLERY_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+gallery_cache = {}
 
 
 def get_gallery_images_cached(item_id, type_key):
     """
     Возвращает список уникальных изображений из папки static/img/wiki/<type_folder>/<item_id>/
-    Без дубликатов по регистру расширения
+    Без дубликатов по регистру расширения. Результат кэшируется до изменения папки
     """
     if not item_id or not type_key:
         return []
@@ -253,30 +1328,44 @@ def get_gallery_images_cached(item_id, type_key):
         app.static_folder, "img", "wiki", folder_type, str(item_id)
     )
 
-    if not os.path.exists(folder_path):
+    cache_key = (type_key, str(item_id))
+    try:
+        mtime = os.stat(folder_path).st_mtime_ns
+    except OSError:
+        gallery_cache.pop(cache_key, None)
         return []
 
-    # Ищем только по строчным расширениям — этого достаточно (Windows нечувствителен к регистру)
-    extensions = ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp"]
+    cached = gallery_cache.get(cache_key)
+    count_cache("gallery", cached is not None and cached[0] == mtime)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
     images = []
-    seen_files = set()  # Для дополнительной защиты от дублей
-
-    for ext in extensions:
-        pattern = os.path.join(folder_path, ext)
-        for file_path in glob.glob(pattern):
-            filename = os.path.basename(
-                file_path
-            ).lower()  # Приводим к нижнему регистру для сравнения
-            if filename in seen_files:
-                continue
-            seen_files.add(filename)
+    seen_files = set()  # Для защиты от дублей, отличающихся только регистром
 
-            rel_url = f"/static/img/wiki/{folder_type}/{item_id}/{os.path.basename(file_path)}"
-            images.append({"url": rel_url, "original": os.path.basename(file_path)})
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            lower_name = entry.name.lower()
+            if os.path.splitext(lower_name)[1] not in GALLERY_EXTENSIONS:
+                continue
+            if lower_name in seen_files or not entry.is_file():
+                continue
+            seen_files.add(lower_name)
+
+            static_path = f"img/wiki/{folder_type}/{item_id}/{entry.name}"
+            images.append(
+                {
+                    "url": f"/static/{static_path}",
+                    "original": entry.name,
+                    "thumb": thumb_url("static", static_path, 160),
+                    "srcset": thumb_srcset("static", static_path),
+                }
+            )
 
     # Сортируем по оригинальному имени файла (с сохранением регистра)
     images.sort(key=lambda x: x["original"].lower())
 
+    gallery_cache[cache_key] = (mtime, images)
     return images
 
 
@@ -290,47 +1379,95 @@ def index():
 def wiki():
     return render_template(
         "wiki.html",
-        orgs_json=orgs,
-        persons_json=persons,
-        events_json=events,
+        facets=wiki_facet_options(),
+        page_size=WIKI_PAGE_SIZE,
         min_year_bound=MIN_YEAR,
         max_year_bound=MAX_YEAR,
-        max_members_bound=MAX_MEMBERS,
+        max_members_bound=pages_store.derived("organizations.json")["max_members"],
     )
 
 
-@app.route("/wiki/<path:slug>")
-def wiki_detail(slug):
-    item, item_type = find_item_by_slug_or_id(slug)
-    if not item:
-        abort(404)
+@app.route("/api/wiki")
+def wiki_api():
+    """
+    Постраничный список элементов вики с серверной фильтрацией.
+    Параметры: type (org/person/event), q, year_from, year_to,
+    members_from, members_to, leader/reason/event_type (можно несколько),
+    sort (default/name/year/members), order (asc/desc), limit, cursor
+    """
+    version = wiki_catalog_version
+    catalog = wiki_catalog.get(request.args.get("type", "org"))
+    if catalog is None:
+        return jsonify({"error": "unknown type"}), 400
+
+    sort = request.args.get("sort", "default")
+    if sort not in WIKI_SORTS:
+        return jsonify({"error": "unknown sort"}), 400
+
+    limit = request.args.get("limit", type=int, default=WIKI_PAGE_SIZE)
+    limit = min(max(limit, 1), WIKI_MAX_PAGE_SIZE)
+
+    # Курсор — "<версия данных>.<смещение>": после правки в админке старый
+    # курсор недействителен, и клиент начинает список заново
+    offset = 0
+    cursor = request.args.get("cursor")
+    if cursor:
+        cursor_version, _, cursor_offset = cursor.partition(".")
+        if cursor_version != version or not cursor_offset.isdigit():
+            return jsonify({"error": "stale cursor"}), 409
+        offset = int(cursor_offset)
+
+    facets = {
+        name: request.args.getlist(name)
+        for name in ("leader", "reason", "event_type")
+        if request.args.getlist(name)
+    }
+    positions = catalog.query(
+        text=request.args.get("q", "").strip(),
+        year_from=request.args.get("year_from", type=int),
+        year_to=request.args.get("year_to", type=int),
+        members_from=request.args.get("members_from", type=int),
+        members_to=request.args.get("members_to", type=int),
+        facets=facets,
+        sort=sort,
+        descending=request.args.get("order") == "desc",
+    )
 
-    item_id = item.get("id")
+    page = positions[offset : offset + limit]
+    next_offset = offset + len(page)
+    return jsonify(
+        {
+            "items": [catalog.cards[pos] for pos in page],
+            "total": len(positions),
+            "next_cursor": f"{version}.{next_offset}"
+            if next_offset < len(positions)
+            else None,
+        }
+    )
 
-    # === Генерация данных для шаблона ===
-    def calculate_timespan(start, end=None):
-        if not start:
-            return "Неизвестно"
-        try:
-            if end and end != "null":
-                end_display = end
-            else:
-                end_display = "наст. время"
-            return f"{start} – {end_display}"
-        except:
-            return f"{start} – {end or 'наст. время'}"
 
-    item_name = html_module.escape(item.get("name", "Unknown"))
-    description_safe = markdown.markdown(
-        item.get("description", ""),
-        extensions=[
-            "markdown.extensions.extra",
-            "markdown.extensions.nl2br",
-            "pymdownx.magiclink",
-        ],
+@app.route("/search")
+def search():
+    """Поиск по вики для подсказок: /search?q=...&type=org|person|event&limit=N"""
+    query = request.args.get("q", "").strip()
+    item_type = request.args.get("type")
+    if item_type and item_type not in wiki_catalog:
+        abort(400)
+    limit = request.args.get("limit", SEARCH_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    doc_filter = (lambda key: key[0] == item_type) if item_type else None
+    results = wiki_search.search(query, limit, doc_filter)
+    return jsonify(
+        {
+            "query": query,
+            "results": [dict(meta, score=score) for score, meta in results],
+        }
     )
 
-    # Галерея
+
+def render_gallery_html(item_id, item_type):
+    """Собирает HTML галереи изображений элемента вики"""
     avatar_urls = []
     if item_type in ("org", "person"):
         avatar_urls = get_gallery_images_cached(item_id, item_type)
@@ -339,9 +1476,11 @@ def wiki_detail(slug):
     for img in avatar_urls:
         safe_url = html_module.escape(img.get("url", ""))
         safe_name = html_module.escape(img.get("original", ""))
+        safe_thumb = html_module.escape(img.get("thumb", ""))
+        safe_srcset = html_module.escape(img.get("srcset", ""))
         avatar_list_html += f"""
             <div class="gallery-item clickable-avatar" data-src="{safe_url}" title="{safe_name}">
-                <img src="{safe_url}" alt="{safe_name}" loading="lazy">
+                <img src="{safe_thumb}" srcset="{safe_srcset}" sizes="150px" alt="{safe_name}" loading="lazy">
             </div>
         """
     avatar_gallery_html = (
@@ -357,6 +1496,34 @@ def wiki_detail(slug):
         else ""
     )
 
+    return avatar_gallery_html
+
+
+def render_wiki_fragments(item, item_type):
+    """Рендерит описание и таблицу полей элемента вики (markdown + HTML)"""
+    # === Генерация данных для шаблона ===
+    def calculate_timespan(start, end=None):
+        if not start:
+            return "Неизвестно"
+        try:
+            if end and end != "null":
+                end_display = end
+            else:
+                end_display = "наст. время"
+            return f"{start} – {end_display}"
+        except:
+            return f"{start} – {end or 'наст. время'}"
+
+    item_name = html_module.escape(item.get("name", "Unknown"))
+    description_safe = markdown.markdown(
+        item.get("description", ""),
+        extensions=[
+            "markdown.extensions.extra",
+            "markdown.extensions.nl2br",
+            "pymdownx.magiclink",
+        ],
+    )
+
     # Таблица
     item_fields_html = ""
     translation_map = {
@@ -441,17 +1608,46 @@ def wiki_detail(slug):
             f"<tr><td>{label}</td><td class='scrollable-cell'>{val}</td></tr>"
         )
 
+    return {
+        "item_name": item_name,
+        "item_description_safe": description_safe,
+        "item_fields_html": item_fields_html,
+    }
+
+
+@app.route("/wiki/<path:slug>")
+def wiki_detail(slug):
+    version = wiki_data_version
+    item, item_type = find_item_by_slug_or_id(slug)
+    if not item:
+        abort(404)
+
+    item_id = item.get("id")
+
+    # Markdown и таблица меняются только при сохранении в админке
+    cache_key = (item_type, str(item_id), version)
+    fragments = wiki_render_cache.get(cache_key)
+    if fragments is None:
+        with app_metrics.time("wiki_markdown_render_seconds"):
+            fragments = render_wiki_fragments(item, item_type)
+        wiki_render_cache.set(cache_key, fragments)
+
     return render_template(
         "wikipage.html",
-        item_name=item_name,
-        item_description_safe=description_safe,
-        item_fields_html=item_fields_html,
-        avatar_gallery_html=avatar_gallery_html,
+        avatar_gallery_html=render_gallery_html(item_id, item_type),
+        **fragments,
     )
 
 
 @app.route("/servers")
 def servers():
+    servers_data = servers_snapshot.data
+    if live_view.guilds:
+        # Свежие счётчики от бота поверх данных из файлов
+        servers_data = {
+            guild_id: dict(data, info=live_view.merge(guild_id, data.get("info", {})))
+            for guild_id, data in servers_data.items()
+        }
     sorted_servers = sorted(
         servers_data.items(), key=lambda x: x[1].get("info", {}).get("name", "").lower()
     )
@@ -461,72 +1657,174 @@ def servers():
     )
 
 
-# Кэш для slug → guild_id (чтобы быстро находить по названию)
-server_slug_cache = {}
-
-
-@app.route("/server/<slug>")
-def server_detail(slug):
+def resolve_guild_id(slug, snapshot):
+    """Находит guild_id по slug или ID; None, если сервера нет"""
     guild_id = None
 
     # 1. Сначала ищем по slug в кэше (название → ID)
-    if slug in server_slug_cache:
-        guild_id = server_slug_cache[slug]
+    if slug in snapshot.slugs:
+        guild_id = snapshot.slugs[slug]
 
     # 2. Если не нашли — проверяем, является ли slug чистым ID
-    elif slug.isdigit() and slug in servers_data:
+    elif slug.isdigit() and slug in snapshot.data:
         guild_id = slug
 
-    # 3. Если ничего не нашли — 404
-    if not guild_id or guild_id not in servers_data:
+    if not guild_id or guild_id not in snapshot.data:
+        return None
+    return guild_id
+
+
+def get_server_history(guild_id, start=None, end=None):
+    """Точки истории сервера за период [start, end] (unix-время)"""
+    if storage is not None:
+        return storage.history_range(guild_id, start, end)
+
+    if os.path.exists(history_store.history_path(SERVERS_HISTORY_DIR, guild_id)):
+        return history_store.read_range(SERVERS_HISTORY_DIR, guild_id, start, end)
+
+    # Бот ещё не перенёс историю из старого JSON
+    history = server_section(guild_id, "history")
+    return [
+        point
+        for point in history
+        if (start is None or point.get("timestamp", 0) >= start)
+        and (end is None or point.get("timestamp", 0) <= end)
+    ]
+
+
+# Сколько точек отдавать по умолчанию на график
+HISTORY_MAX_POINTS = 500
+
+
+def query_server_history(guild_id, start=None, end=None, max_points=HISTORY_MAX_POINTS):
+    """
+    Выбирает уровень детализации истории под период и бюджет точек:
+    самый подробный уровень, который ещё хранит начало периода и даёт
+    не больше max_points интервалов. Возвращает (уровень, точки)
+    """
+    now = time.time()
+    end = now if end is None else end
+    start = end - 86400 if start is None else start
+    span = max(end - start, 0)
+
+    tier = history_store.TIERS[-1][0]
+    for name, step, retention in history_store.TIERS:
+        if retention is not None and start < now - retention:
+            continue
+        if span / step <= max_points:
+            tier = name
+            break
+
+    step = history_store.TIER_STEPS[tier]
+    if tier == "raw":
+        points = get_server_history(guild_id, start, end)
+    elif storage is not None:
+        # В базе хранятся только исходные точки — агрегируем запросом
+        points = storage.history_range(guild_id, start, end, step)
+    elif os.path.exists(history_store.history_path(SERVERS_HISTORY_DIR, guild_id)):
+        # Записанные агрегаты плюс открытый интервал из сырых точек
+        points = history_store.read_tier_range(SERVERS_HISTORY_DIR, guild_id, tier, start, end)
+    else:
+        # История ещё не перенесена из JSON — агрегируем её точки сами
+        points = history_store.aggregate_points(get_server_history(guild_id, start, end), step)
+
+    # Точки бывают неравномерными (старая история из JSON) — бюджет
+    # соблюдаем на любом пути
+    return tier, history_store.downsample(points, max_points)
+
+
+@app.route("/server/<slug>")
+def server_detail(slug):
+    snapshot = servers_snapshot
+    guild_id = resolve_guild_id(slug, snapshot)
+    if not guild_id:
         abort(404)
 
-    data = servers_data[guild_id]
-    info = data.get("info", {})
+    info = live_view.merge(guild_id, snapshot.data[guild_id].get("info", {}))
+    server = {"info": info, "member_overlaps": server_section(guild_id, "member_overlaps")}
 
     return render_template(
-        "server_detail.html", server=data, info=info, guild_id=guild_id
+        "server_detail.html", server=server, info=info, guild_id=guild_id
     )
 
 
-@app.route("/guides")
-def guides():
-    guides_json_path = os.path.join(DATA_PAGES_DIR, "guides.json")
-    guides_list = []
+# SSE: поля, которые уходят в браузер, и параметры потоков. Поток занимает
+# поток воркера (gthread), поэтому их число ограничено, а сам поток
+# закрывается через LIVE_STREAM_SECONDS — браузер переподключится сам
+LIVE_STREAM_FIELDS = ("member_count", "online_count", "premium_subscription_count")
+LIVE_STREAM_SECONDS = float(os.getenv("LIVE_STREAM_SECONDS", "300"))
+LIVE_PING_SECONDS = 15
+LIVE_RETRY_MS = 5000
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", "16"))
+live_stream_slots = threading.BoundedSemaphore(LIVE_MAX_STREAMS)
+
+
+def live_stream(guild_id=None):
+    """Поток событий stats: {guild_id: изменившиеся поля}. Первое событие —
+    текущие живые значения, дальше — только изменения"""
+    if not live_stream_slots.acquire(blocking=False):
+        # 204 останавливает переподключения EventSource; страница повторит позже
+        return Response(status=204)
+
+    def generate():
+        version, changes = live_view.changes_since(0, LIVE_STREAM_FIELDS, guild_id)
+        yield f"retry: {LIVE_RETRY_MS}\n\n"
+        deadline = time.monotonic() + LIVE_STREAM_SECONDS
+        while True:
+            if changes:
+                data = json.dumps(changes, ensure_ascii=False, separators=(",", ":"))
+                yield f"event: stats\ndata: {data}\n\n"
+            if time.monotonic() >= deadline:
+                return
+            new_version = live_view.wait(version, LIVE_PING_SECONDS)
+            if new_version == version:
+                yield ": ping\n\n"  # заодно узнаём об ушедшем клиенте
+                changes = None
+                continue
+            version, changes = live_view.changes_since(version, LIVE_STREAM_FIELDS, guild_id)
 
-    if os.path.exists(guides_json_path):
-        try:
-            with open(guides_json_path, "r", encoding="utf-8") as f:
-                raw_guides = json.load(f)
-
-            for guide in raw_guides:
-                title = guide.get("title", "Без названия")
-                source = guide.get("source", "")
-                guide_type = guide.get("type", "image")  # image или youtube
-
-                if guide_type == "youtube":
-                    # Извлекаем video_id из ссылки YouTube
-                    match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11})", source)
-                    if match:
-                        video_id = match.group(1)
-                        preview_url = (
-                            f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-                        )
-                        link = source
-                    else:
-                        preview_url = None
-                        link = "#"
-                else:  # image
-                    preview_url = url_for("static", filename=f"img/guides/{source}")
-                    link = preview_url  # Клик открывает изображение
-
-                if preview_url:
-                    guides_list.append(
-                        {"title": title, "preview_url": preview_url, "link": link}
-                    )
-        except Exception as e:
-            print(f"Ошибка загрузки guides.json: {e}")
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(live_stream_slots.release)
+    return response
+
+
+@app.route("/servers/stream")
+def servers_stream():
+    return live_stream()
+
+
+@app.route("/server/<slug>/stream")
+def server_stream(slug):
+    guild_id = resolve_guild_id(slug, servers_snapshot)
+    if not guild_id:
+        abort(404)
+    return live_stream(guild_id)
 
+
+@app.route("/api/server/<slug>/history")
+def server_history_api(slug):
+    """
+    История участников/онлайна: ?start=&end= — unix-время (по умолчанию
+    последние сутки), ?points= — сколько точек максимум нужно графику
+    """
+    guild_id = resolve_guild_id(slug, servers_snapshot)
+    if not guild_id:
+        abort(404)
+
+    start = request.args.get("start", type=float)
+    end = request.args.get("end", type=float)
+    max_points = request.args.get("points", type=int, default=HISTORY_MAX_POINTS)
+    max_points = min(max(max_points, 1), 5000)
+
+    tier, points = query_server_history(guild_id, start, end, max_points)
+    return jsonify({"guild_id": guild_id, "tier": tier, "points": points})
+
+
+@app.route("/guides")
+def guides():
+    guides_list = (pages_store.derived("guides.json") or {}).get("guides", [])
     return render_template(
         "guides.html", guides=guides_list, total_guides=len(guides_list)
     )
@@ -534,42 +1832,12 @@ def guides():
 
 @app.route("/materials")
 def materials():
-    materials_json_path = os.path.join(DATA_PAGES_DIR, "materials.json")
-    materials_list = []
-    all_tags = set()
-
-    if os.path.exists(materials_json_path):
-        try:
-            with open(materials_json_path, "r", encoding="utf-8") as f:
-                raw_materials = json.load(f)
-
-            for mat in raw_materials:
-                title = mat.get("title", "Без названия")
-                image = mat.get("image", "")
-                tag = mat.get("tag", "Без категории")  # Теперь один тег — поле "tag"
-
-                all_tags.add(tag)
-
-                preview_url = (
-                    url_for("static", filename=f"img/materials/{image}")
-                    if image
-                    else None
-                )
-
-                if preview_url:
-                    materials_list.append(
-                        {"title": title, "preview_url": preview_url, "tag": tag}
-                    )
-        except Exception as e:
-            print(f"Ошибка загрузки materials.json: {e}")
-
-    # Добавляем "Все" в начало
-    sorted_tags = ["Все"] + sorted(all_tags - {"Все"})
-
+    derived = pages_store.derived("materials.json") or {}
+    materials_list = derived.get("materials", [])
     return render_template(
         "materials.html",
         materials=materials_list,
-        tags=sorted_tags,
+        tags=derived.get("tags", ["Все"]),
         total_materials=len(materials_list),
     )
 
@@ -583,7 +1851,7 @@ def info():
 
 # Конфигурация
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
-ADMIN_SESSIONS = {}
+# Сессии хранятся в shared_store, чтобы вход работал во всех воркерах
 SESSION_TIMEOUT = 3600  # 1 час
 
 # ============= ХЕЛПЕР ФУНКЦИИ =============
@@ -594,32 +1862,16 @@ def check_admin_auth():
     if "admin_token" not in session:
         return False
     token = session.get("admin_token")
-    if token not in ADMIN_SESSIONS:
+    expires = shared_store.session_expires(token)
+    if expires is None:
         return False
-    if time.time() > ADMIN_SESSIONS[token]:
-        del ADMIN_SESSIONS[token]
+    if time.time() > expires:
+        shared_store.remove_session(token)
         session.pop("admin_token", None)
         return False
     return True
 
 
-def load_admin_json(filename):
-    """Загружает JSON для админ-панели"""
-    filepath = os.path.join(DATA_PAGES_DIR, filename)
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return []
-
-
-def save_admin_json(filename, data):
-    """Сохраняет JSON из админ-панели"""
-    filepath = os.path.join(DATA_PAGES_DIR, filename)
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
-
 def process_form_data(params, filename):
     """Обрабатывает данные формы админ-панели"""
     new_item = {
@@ -671,7 +1923,7 @@ def admin_login():
         password = request.form.get("password", "")
         if password == ADMIN_PASSWORD:
             token = secrets.token_hex(16)
-            ADMIN_SESSIONS[token] = time.time() + SESSION_TIMEOUT
+            shared_store.add_session(token, time.time() + SESSION_TIMEOUT)
             session["admin_token"] = token
             flash("Вы успешно авторизованы", "success")
             return redirect(url_for("admin_panel"))
@@ -694,8 +1946,8 @@ def admin_panel():
 def admin_logout():
     """Выход из админ-панели"""
     token = session.get("admin_token")
-    if token in ADMIN_SESSIONS:
-        del ADMIN_SESSIONS[token]
+    if token:
+        shared_store.remove_session(token)
     session.pop("admin_token", None)
     flash("Вы вышли из админ-панели", "success")
     return redirect(url_for("admin_login"))
@@ -706,21 +1958,24 @@ def admin_edit(filename):
     if not check_admin_auth():
         return redirect(url_for("admin_login"))
 
-    # Определяем где хранится файл
-    if filename.startswith(("materials/", "guides/")):
-        filepath = os.path.join(app.root_path, "static", "img", filename)
+    # Файлы pages_data живут в хранилище, остальные читаются с диска
+    in_store = filename in pages_store.snapshot().files
+    if in_store:
+        data = pages_store.get(filename)
     else:
-        filepath = os.path.join(DATA_PAGES_DIR, filename)
+        if filename.startswith(("materials/", "guides/")):
+            filepath = os.path.join(app.root_path, "static", "img", filename)
+        else:
+            filepath = os.path.join(DATA_PAGES_DIR, filename)
 
-    if not os.path.exists(filepath):
-        abort(404)
+        if not os.path.exists(filepath):
+            abort(404)
 
-    # Загружаем данные
-    with open(filepath, "r", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            data = []
+        with open(filepath, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = []
 
     # Индекс редактируемой записи
     idx = request.args.get("id", type=int, default=None)
@@ -749,16 +2004,22 @@ def admin_edit(filename):
                 new_item["description"] = form_data.get("description", [""])[0]
 
         form_idx = int(request.form.get("index", -1))
-        if form_idx == -1:
-            data.append(new_item)
-            idx = len(data) - 1
-        else:
-            data[form_idx] = new_item
-            idx = form_idx
+
+        def apply(items):
+            if form_idx == -1:
+                items.append(new_item)
+                return len(items) - 1
+            items[form_idx] = new_item
+            return form_idx
 
         # Сохраняем
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        if in_store:
+            idx = update_pages_data(filename, apply)
+        else:
+            data = list(data)
+            idx = apply(data)
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
 
         flash("Запись успешно сохранена", "success")
         return redirect(url_for("admin_edit", filename=filename, id=idx))
@@ -783,39 +2044,63 @@ def admin_delete(filename):
     if not filename.endswith(".json") or "/" in filename or "\\" in filename:
         abort(400)
 
-    filepath = os.path.join(DATA_PAGES_DIR, filename)
-    if not os.path.exists(filepath):
+    if filename not in pages_store.snapshot().files:
         abort(404)
 
-    data = load_admin_json(filename)
     idx = int(request.form.get("index", -1))
 
-    if 0 <= idx < len(data):
-        deleted_item = data.pop(idx)
-        save_admin_json(filename, data)
-
-        # Обновляем глобальные переменные
-        global organizations_data, personalities_data, events_data
-        if "organizations" in filename:
-            organizations_data = data
-        elif "personalities" in filename:
-            personalities_data = data
-        elif "events" in filename:
-            events_data = data
-
+    if 0 <= idx < len(pages_store.get(filename)):
+        deleted_item = update_pages_data(filename, lambda items: items.pop(idx))
         flash(
             f'Запись "{deleted_item.get("name") or deleted_item.get("id")}" успешно удалена',
             "success",
         )
 
-    return redirect(url_for("admin_editor", filename=filename))
+    return redirect(url_for("admin_edit", filename=filename))
 
 
 @app.route("/admin_static/<path:filename>")
 def admin_static_files(filename):
     """Отдача статических файлов админ-панели"""
     admin_static_dir = os.path.join(os.path.dirname(__file__), "admin_static")
-    return send_from_directory(admin_static_dir, filename)
+    return send_cached_file(admin_static_dir, filename, STATIC_MAX_AGE)
+
+
+# =========================
+# /metrics для Prometheus
+# =========================
+
+LOCAL_ADDRESSES = {"127.0.0.1", "::1"}
+
+
+def servers_data_age():
+    """Сколько секунд назад бот последний раз записал данные серверов"""
+    signatures = servers_file_stats.values()
+    if not signatures:
+        return {}
+    newest = max(signature[0] for signature in signatures) / 1e9
+    return {(): round(time.time() - newest, 3)}
+
+
+app_metrics.gauge(
+    "servers_data_age_seconds", "Возраст самых свежих данных серверов", servers_data_age
+)
+app_metrics.gauge(
+    "servers_loaded", "Серверов в памяти", lambda: {(): len(servers_snapshot.data)}
+)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Только с этой машины и не через обратный прокси (он добавляет заголовки)
+    if request.remote_addr not in LOCAL_ADDRESSES or (
+        "X-Forwarded-For" in request.headers or "X-Real-IP" in request.headers
+    ):
+        abort(404)
+    response = make_response(app_metrics.render())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк кэширования иконок на странице /servers
+
+Иконки на странице — WebP-миниатюры (/thumbs/assets/...). Бенчмарк
+эмулирует браузер с HTTP-кэшем (учитывает max-age/immutable и шлёт
+If-None-Match) и считает запросы и переданные байты картинок для
+первого и повторных визитов (с паузой --gap секунд по модельным часам).
+Для сравнения — клиент без кэша и размер оригиналов из servers/assets/.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_assets.py [--visits 5] [--gap 7200]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+from urllib.parse import unquote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as site
+
+
+class BrowserCache:
+    """Минимальная модель HTTP-кэша браузера"""
+
+    def __init__(self, client, use_cache=True):
+        self.client = client
+        self.use_cache = use_cache
+        self.entries = {}  # url → (etag, fresh_until)
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes = 0
+        self.immutable = set()
+        self.clock = 0.0  # модельное время, секунды
+
+    def get(self, url):
+        entry = self.entries.get(url) if self.use_cache else None
+        if entry and entry[1] > self.clock:
+            return  # свежая копия — запроса нет
+        headers = {"If-None-Match": entry[0]} if entry else {}
+
+        # Без Pillow миниатюра перенаправляет на оригинал
+        response = self.client.get(url, headers=headers, follow_redirects=True)
+        self.requests += 1
+        self.bytes += len(response.data)
+        if response.status_code == 304:
+            self.not_modified += 1
+
+        max_age = response.cache_control.max_age or 0
+        if response.cache_control.immutable:
+            self.immutable.add(url)
+        self.entries[url] = (response.headers.get("ETag"), self.clock + max_age)
+
+
+def asset_urls(client):
+    """URL иконок из src (браузер без srcset и с маленьким экраном берёт их)"""
+    html = client.get("/servers").get_data(as_text=True)
+    return sorted(set(re.findall(r'src="(/thumbs/assets/\d+/[^"]+)"', html)))
+
+
+def original_size(url):
+    filename = unquote(url.split("/", 4)[4])
+    try:
+        return os.path.getsize(os.path.join(site.ASSETS_DIR, filename))
+    except OSError:
+        return 0
+
+
+def run_visits(client, urls, visits, gap, use_cache):
+    browser = BrowserCache(client, use_cache)
+    results = []
+    for visit in range(visits):
+        browser.clock = visit * gap
+        before = (browser.requests, browser.not_modified, browser.bytes)
+        for url in urls:
+            browser.get(url)
+        results.append(
+            (
+                browser.requests - before[0],
+                browser.not_modified - before[1],
+                browser.bytes - before[2],
+            )
+        )
+    return results, browser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--visits", type=int, default=5)
+    parser.add_argument("--gap", type=float, default=7200, help="пауза между визитами, с")
+    args = parser.parse_args()
+
+    client = site.app.test_client()
+    urls = asset_urls(client)
+    if not urls:
+        sys.exit("На /servers не найдено иконок (/thumbs/assets/...) — нечего измерять")
+    originals = sum(original_size(u) for u in urls)
+    print(f"Иконок на /servers: {len(urls)}, оригиналы: {originals / 1024:.1f} КБ")
+
+    for title, use_cache in (("Без кэша", False), ("С кэшем браузера", True)):
+        print(f"\n{title}:")
+        total_requests = total_bytes = 0
+        results, browser = run_visits(client, urls, args.visits, args.gap, use_cache)
+        for i, (requests, not_modified, size) in enumerate(results, 1):
+            total_requests += requests
+            total_bytes += size
+            print(
+                f"  визит {i}: запросов {requests:3d} (304: {not_modified:3d}), "
+                f"{size / 1024:9.1f} КБ"
+            )
+        print(f"  итого: запросов {total_requests}, {total_bytes / 1024:.1f} КБ")
+        if use_cache:
+            print(f"  с immutable: {len(browser.immutable)} из {len(urls)}")
+
+
+if __name__ == "__main__":
+    main()
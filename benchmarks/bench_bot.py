@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн-симулятор Discord и бенчмарк конвейера данных bot.py
+
+Модель: N серверов × M участников. Доля --overlap участников каждого
+сервера берётся из общего пула (так получаются пересечения), остальные
+уникальны. За тик доля --churn участников каждого сервера выходит,
+столько же входит и ещё столько же меняет статус — события идут через
+обработчики бота (on_member_join/remove, on_presence_update).
+
+Работает настоящий код bot.py — update_server_data, fetch_server_info,
+индекс пересечений, auto_update, full_resync — только вместо gateway
+фальшивые объекты серверов и участников, а данные пишутся во временный
+каталог (SERVERS_DATA_DIR). Сеть не нужна.
+
+Для каждой фазы (первичное сканирование, события, тики, полное
+пересканирование) считаются: длительность, блокировка event loop
+(задержка пробуждения сэмплера), записанные байты (/proc/self/io) и
+пиковая память Python (tracemalloc). tracemalloc замедляет код примерно
+вдвое — для чистых времён запускайте с --no-memory.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_bot.py [--guilds 100] [--members 1000]
+        [--overlap 0.3] [--churn 0.01] [--ticks 5] [--storage json|sqlite]
+        [--asset-latency 0] [--no-memory] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+JOINED_AT = datetime(2023, 1, 1, tzinfo=timezone.utc)
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(2048)
+
+
+# ===== ФАЛЬШИВЫЙ DISCORD =====
+
+
+class FakeAsset:
+    """Иконка/баннер: ключ-хэш и скачивание с заданной задержкой"""
+
+    def __init__(self, key, latency):
+        self.key = key
+        self.latency = latency
+
+    def with_format(self, _format):
+        return self
+
+    async def read(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return PNG_BYTES
+
+
+class FakeMember:
+    __slots__ = ("id", "display_name", "bot", "status", "joined_at", "guild")
+
+    def __init__(self, member_id, guild, status, is_bot=False):
+        self.id = member_id
+        self.display_name = f"user{member_id}"
+        self.bot = is_bot
+        self.status = status
+        self.joined_at = JOINED_AT
+        self.guild = guild
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name, asset_latency):
+        self.id = guild_id
+        self.name = name
+        self.description = f"Тестовый сервер {name}"
+        self.created_at = JOINED_AT
+        self.icon = FakeAsset(f"icon{guild_id}", asset_latency)
+        self.banner = None
+        self.owner_id = 1
+        self.owner = None
+        self.premium_tier = 0
+        self.premium_subscription_count = 0
+        self.features = []
+        self.vanity_url_code = None
+        self.member_map = {}
+
+    @property
+    def members(self):
+        return list(self.member_map.values())
+
+    @property
+    def member_count(self):
+        return len(self.member_map)
+
+
+class FakeCluster:
+    """Набор серверов с пересекающимися участниками и генератор событий"""
+
+    def __init__(self, guilds, members, overlap, churn, asset_latency, seed):
+        import discord
+
+        self.statuses = [discord.Status.online, discord.Status.idle, discord.Status.offline]
+        self.random = random.Random(seed)
+        self.overlap = overlap
+        self.churn = churn
+        # Общий пул вдвое больше сервера: участник пула в среднем
+        # состоит в guilds * overlap / 2 серверах
+        self.pool_size = max(1, members * 2)
+        self.next_unique_id = 10**12
+        self.guilds = []
+        for i in range(guilds):
+            guild = FakeGuild(10**15 + i, f"Сервер {i}", asset_latency)
+            while guild.member_count < members:
+                self._join(guild)
+            self.guilds.append(guild)
+
+    def _new_member_id(self, guild):
+        if self.random.random() < self.overlap:
+            member_id = 1000 + self.random.randrange(self.pool_size)
+            if member_id not in guild.member_map:
+                return member_id
+        self.next_unique_id += 1
+        return self.next_unique_id
+
+    def _join(self, guild):
+        member_id = self._new_member_id(guild)
+        member = FakeMember(
+            member_id,
+            guild,
+            self.random.choice(self.statuses),
+            is_bot=self.random.random() < 0.02,
+        )
+        guild.member_map[member_id] = member
+        return member
+
+    def churn_events(self):
+        """Список (имя обработчика, аргументы) для одного тика; состав
+        серверов меняется сразу, как это сделал бы кэш discord.py"""
+        events = []
+        for guild in self.guilds:
+            count = max(1, int(guild.member_count * self.churn)) if self.churn else 0
+            for member in self.random.sample(list(guild.member_map.values()), count):
+                del guild.member_map[member.id]
+                events.append(("on_member_remove", (member,)))
+            for _ in range(count):
+                events.append(("on_member_join", (self._join(guild),)))
+            for before in self.random.sample(list(guild.member_map.values()), count):
+                after = FakeMember(
+                    before.id,
+                    guild,
+                    self.random.choice(self.statuses),
+                    is_bot=before.bot,
+                )
+                guild.member_map[before.id] = after
+                events.append(("on_presence_update", (before, after)))
+        return events
+
+
+# ===== ИЗМЕРЕНИЯ =====
+
+
+class LoopLagSampler:
+    """Просыпается каждые interval секунд; опоздание пробуждения — время,
+    на которое event loop был занят синхронным кодом"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.max_lag = 0.0
+        self.blocked = 0.0
+
+    async def settle(self):
+        """Даёт сэмплеру проснуться и учесть накопившееся опоздание"""
+        await asyncio.sleep(self.interval * 2)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > 0.001:
+                self.blocked += lag
+
+
+def written_bytes():
+    """Байты, записанные процессом (включая потоки), по /proc/self/io"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Phase:
+    def __init__(self, name, sampler, trace_memory):
+        self.name = name
+        self.sampler = sampler
+        self.trace_memory = trace_memory
+        self.result = {"phase": name}
+
+    async def __aenter__(self):
+        await self.sampler.settle()
+        self.sampler.reset()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.bytes_before = written_bytes()
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc):
+        duration = time.perf_counter() - self.started
+        bytes_after = written_bytes()
+        # Блокировка в конце фазы засчитывается ей, а не следующей
+        await self.sampler.settle()
+        self.result.update(
+            duration_ms=round(duration * 1000, 1),
+            loop_max_lag_ms=round(self.sampler.max_lag * 1000, 1),
+            loop_blocked_ms=round(self.sampler.blocked * 1000, 1),
+            written_kb=(
+                round((bytes_after - self.bytes_before) / 1024, 1)
+                if bytes_after is not None else None
+            ),
+            peak_mb=(
+                round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+                if self.trace_memory else None
+            ),
+        )
+
+
+# ===== ПРОГОН =====
+
+
+async def simulate(bot, cluster, ticks, trace_memory):
+    sampler = LoopLagSampler()
+    sampler_task = asyncio.create_task(sampler.run())
+    await asyncio.sleep(0)
+    results = []
+
+    def phase(name):
+        p = Phase(name, sampler, trace_memory)
+        results.append(p.result)
+        return p
+
+    # Вместо подключения к gateway — список фальшивых серверов
+    bot.bot = type("FakeBot", (), {"guilds": cluster.guilds})()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Как on_ready: полное сканирование, затем первый тик сохраняет всё
+        async with phase("первичное сканирование"):
+            await bot.refresh_guilds(cluster.guilds)
+            bot.last_full_resync = time.time()
+            await bot.persist_dirty_guilds()
+
+        for tick in range(1, ticks + 1):
+            events = cluster.churn_events()
+            async with phase(f"события тика {tick}") as p:
+                for handler, args in events:
+                    await getattr(bot, handler)(*args)
+                p.result["events"] = len(events)
+            async with phase(f"тик {tick}") as p:
+                p.result["dirty_guilds"] = len(bot.dirty_guilds)
+                await bot.auto_update.coro()
+
+        async with phase("полное пересканирование"):
+            await bot.full_resync()
+            await bot.persist_dirty_guilds()
+
+    sampler_task.cancel()
+    return results
+
+
+def print_results(results):
+    print(
+        f"\n  {'фаза':<26} {'время мс':>10} {'блок. мс':>10} {'макс. лаг':>10} "
+        f"{'запись КБ':>11} {'пик МБ':>8}"
+    )
+    for row in results:
+        extra = ""
+        if "events" in row:
+            extra = f"  событий: {row['events']}"
+        elif "dirty_guilds" in row:
+            extra = f"  изменённых серверов: {row['dirty_guilds']}"
+        print(
+            f"  {row['phase']:<26} {row['duration_ms']:>10.1f} {row['loop_blocked_ms']:>10.1f} "
+            f"{row['loop_max_lag_ms']:>10.1f} {row['written_kb'] or 0:>11.1f} "
+            f"{row['peak_mb'] if row['peak_mb'] is not None else '—':>8}{extra}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--members", type=int, default=1000, help="участников на сервер")
+    parser.add_argument("--overlap", type=float, default=0.3, help="доля участников из общего пула")
+    parser.add_argument("--churn", type=float, default=0.01, help="доля участников, меняющихся за тик")
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--asset-latency", type=float, default=0, help="задержка скачивания иконки, с")
+    parser.add_argument("--no-memory", action="store_true", help="без tracemalloc")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="куда сохранить JSON с результатами")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bench-bot-")
+    os.environ["SERVERS_DATA_DIR"] = data_dir
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["BOT_STATUS_PATH"] = os.path.join(data_dir, "bot_status.json")
+    os.environ.pop("STORAGE_DB", None)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import bot
+
+        started = time.perf_counter()
+        cluster = FakeCluster(
+            args.guilds, args.members, args.overlap, args.churn, args.asset_latency, args.seed
+        )
+        print(
+            f"Серверов: {args.guilds}, участников на сервер: {args.members}, "
+            f"пересечение: {args.overlap:.0%}, churn за тик: {args.churn:.1%}, "
+            f"хранилище: {args.storage} (модель построена за "
+            f"{time.perf_counter() - started:.1f} с)"
+        )
+
+        if not args.no_memory:
+            tracemalloc.start()
+        results = asyncio.run(simulate(bot, cluster, args.ticks, not args.no_memory))
+        if not args.no_memory:
+            tracemalloc.stop()
+        bot.persist_executor.shutdown(wait=True)
+
+        print_results(results)
+        # Разбивка по фазам из трассировки самого бота (tick_trace)
+        for name, stats in bot.tick_monitor.status()["operations"].items():
+            phases = ", ".join(f"{phase} {t:.1f}" for phase, t in stats["phases_avg_ms"].items())
+            print(f"  {name}: в среднем по фазам, мс — {phases}")
+        size = sum(
+            os.path.getsize(os.path.join(path, name))
+            for path, _, names in os.walk(data_dir)
+            for name in names
+        )
+        print(f"\nРазмер данных на диске: {size / 2**20:.1f} МБ")
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+            print(f"Результаты: {args.output}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
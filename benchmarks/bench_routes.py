@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный бенчмарк маршрутов сайта на синтетических данных
+
+Генерирует pages_data и servers/ размером 1×, 10×, 100× от текущих
+(копии записей с уникальными id и названиями), для каждого масштаба
+запускает сайт в отдельном процессе и гоняет маршруты через тестовый
+клиент Flask, а с --gunicorn — ещё и через локальный gunicorn с
+несколькими параллельными клиентами. Для каждого маршрута считает
+p50/p95/p99, пропускную способность и RSS воркера.
+
+Результаты сохраняются в JSON; --compare сравнивает с прошлым прогоном.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_routes.py [--scales 1,10,100] [--requests 200]
+        [--gunicorn] [--workers 2] [--concurrency 8]
+        [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WIKI_FILES = ("organizations.json", "personalities.json", "events.json")
+ROUTES = (
+    "/wiki",
+    "/wiki/<slug>",
+    "/servers",
+    "/server/<slug>",
+    "/sitemap.xml",
+    "/guides",
+    "/materials",
+    "/api/wiki",
+    "/search",
+)
+
+
+# ===== ДАННЫЕ =====
+
+
+def load_source(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def generate_dataset(target, scale):
+    """Создаёт target/pages_data и target/servers в scale раз больше текущих"""
+    pages_dir = os.path.join(target, "pages_data")
+    servers_dir = os.path.join(target, "servers")
+    os.makedirs(pages_dir)
+    os.makedirs(servers_dir)
+
+    for entry in os.scandir(os.path.join(ROOT, "pages_data")):
+        if not entry.name.endswith(".json"):
+            continue
+        items = load_source(entry.path)
+        copies = []
+        for copy in range(scale):
+            for item in items:
+                item = dict(item)
+                if copy and entry.name in WIKI_FILES:
+                    item["id"] = f"{item.get('id')}-{copy}"
+                    item["name"] = f"{item.get('name') or ''} {copy}"
+                copies.append(item)
+        with open(os.path.join(pages_dir, entry.name), "w", encoding="utf-8") as f:
+            json.dump(copies, f, ensure_ascii=False, indent=4)
+
+    for entry in os.scandir(os.path.join(ROOT, "servers")):
+        if not entry.name.endswith(".json"):
+            continue
+        document = load_source(entry.path)
+        guild_id = entry.name[: -len(".json")]
+        for copy in range(scale):
+            new_id = f"{guild_id}{copy:03d}"
+            info = dict(document.get("info") or {}, id=new_id)
+            if copy:
+                info["name"] = f"{info.get('name') or guild_id} #{copy}"
+            # Порядок ключей — как пишет бот сейчас
+            doc = {
+                "info": info,
+                "member_overlaps": document.get("member_overlaps") or {},
+                "members": document.get("members") or [],
+            }
+            path = os.path.join(servers_dir, f"{new_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(doc, f, ensure_ascii=False)
+
+
+def route_urls(dataset):
+    """Маршрут → список URL, по которым он проходится по кругу"""
+    pages_dir = os.path.join(dataset, "pages_data")
+    servers_dir = os.path.join(dataset, "servers")
+    wiki_ids = [
+        str(item["id"])
+        for filename in WIKI_FILES
+        for item in load_source(os.path.join(pages_dir, filename))
+        if item.get("id")
+    ]
+    guild_ids = sorted(
+        name[: -len(".json")] for name in os.listdir(servers_dir) if name.endswith(".json")
+    )
+    queries = ["map", "рот", "деграмап", "ивент", "ro"]
+    return {
+        "/wiki": ["/wiki"],
+        "/wiki/<slug>": [f"/wiki/{quote(i)}" for i in wiki_ids],
+        "/servers": ["/servers"],
+        "/server/<slug>": [f"/server/{g}" for g in guild_ids],
+        "/sitemap.xml": ["/sitemap.xml"],
+        "/guides": ["/guides"],
+        "/materials": ["/materials"],
+        "/api/wiki": [f"/api/wiki?type={t}" for t in ("org", "person", "event")],
+        "/search": [f"/search?q={quote(q)}" for q in queries],
+    }
+
+
+def dataset_env(dataset):
+    env = dict(os.environ)
+    env.update(
+        SERVERS_DATA_DIR=os.path.join(dataset, "servers"),
+        PAGES_DATA_DIR=os.path.join(dataset, "pages_data"),
+        SHARED_STATE_PATH=os.path.join(dataset, "shared_state.sqlite3"),
+        THUMB_CACHE_DIR=os.path.join(dataset, "thumbs"),
+        METRICS_DIR=os.path.join(dataset, "metrics"),
+        SERVERS_RELOAD_INTERVAL="0",
+        STORAGE_BACKEND="json",
+    )
+    return env
+
+
+# ===== ИЗМЕРЕНИЯ =====
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(route, latencies, elapsed, rss_mb, errors):
+    return {
+        "route": route,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "rss_mb": rss_mb,
+    }
+
+
+def rss_mb(pid="self"):
+    """Текущий RSS процесса по /proc (Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def run_child(dataset, requests):
+    """Выполняется в отдельном процессе: сайт на данных dataset, тестовый клиент"""
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as site
+    startup = time.perf_counter() - started
+
+    client = site.app.test_client()
+    results = []
+    for route, urls in route_urls(dataset).items():
+        for url in urls[:5]:
+            client.get(url)
+
+        latencies = []
+        errors = 0
+        began = time.perf_counter()
+        for i in range(requests):
+            t = time.perf_counter()
+            response = client.get(urls[i % len(urls)])
+            latencies.append(time.perf_counter() - t)
+            errors += response.status_code != 200
+        elapsed = time.perf_counter() - began
+        results.append(summarize(route, latencies, elapsed, rss_mb(), errors))
+
+    print(json.dumps({"startup_s": round(startup, 3), "routes": results}))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def child_pids(parent):
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == parent:
+                    pids.append(int(name))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def run_gunicorn(dataset, requests, workers, concurrency):
+    """Тот же набор маршрутов через локальный gunicorn и concurrency клиентов"""
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "-w", str(workers), "-k", "gthread", "--threads", "4",
+            "-b", f"127.0.0.1:{port}", "app:app",
+        ],
+        cwd=ROOT,
+        env=dataset_env(dataset),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("gunicorn не запустился")
+                time.sleep(0.2)
+
+        local = threading.local()
+
+        def fetch(url):
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            t = time.perf_counter()
+            conn.request("GET", url)
+            response = conn.getresponse()
+            response.read()
+            return time.perf_counter() - t, response.status
+
+        results = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for route, urls in route_urls(dataset).items():
+                list(pool.map(fetch, urls[: max(concurrency, 5)]))
+                began = time.perf_counter()
+                samples = list(pool.map(fetch, (urls[i % len(urls)] for i in range(requests))))
+                elapsed = time.perf_counter() - began
+                worker_rss = [rss_mb(pid) for pid in child_pids(server.pid)]
+                worker_rss = [r for r in worker_rss if r is not None]
+                results.append(
+                    summarize(
+                        route,
+                        [latency for latency, _ in samples],
+                        elapsed,
+                        max(worker_rss) if worker_rss else None,
+                        sum(status != 200 for _, status in samples),
+                    )
+                )
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# ===== ОТЧЁТ =====
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"  {'маршрут':<16} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>9} {'RSS МБ':>8}")
+    for row in rows:
+        print(
+            f"  {row['route']:<16} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+            f"{row['p99_ms']:>9.2f} {row['rps']:>9.1f} {row['rss_mb'] or 0:>8.1f}"
+            + (f"  ошибок: {row['errors']}" if row["errors"] else "")
+        )
+
+
+def print_comparison(previous, current):
+    old = {(r["scale"], r["mode"], r["route"]): r for r in previous["results"]}
+    print(f"\nСравнение с {previous['meta'].get('revision')} (p95, мс):")
+    for row in current["results"]:
+        before = old.get((row["scale"], row["mode"], row["route"]))
+        if before is None:
+            continue
+        delta = (row["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+        print(
+            f"  {row['scale']:>4}× {row['mode']:<8} {row['route']:<16} "
+            f"{before['p95_ms']:>9.2f} → {row['p95_ms']:>9.2f} ({delta:+.0f}%)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1,10,100")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на маршрут")
+    parser.add_argument("--gunicorn", action="store_true", help="также через gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", help="куда сохранить JSON с результатами")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.requests)
+        return
+
+    if args.gunicorn and importlib.util.find_spec("gunicorn") is None:
+        print("gunicorn не установлен — замеры через него пропущены")
+        args.gunicorn = False
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "requests": args.requests,
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+        },
+        "startup": {},
+        "results": [],
+    }
+
+    for scale in (int(s) for s in args.scales.split(",")):
+        dataset = tempfile.mkdtemp(prefix=f"bench-routes-{scale}x-")
+        try:
+            generate_dataset(dataset, scale)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", dataset,
+                 "--requests", str(args.requests)],
+                cwd=ROOT,
+                env=dataset_env(dataset),
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            child = json.loads(output.strip().splitlines()[-1])
+            report["startup"][str(scale)] = child["startup_s"]
+            print_table(
+                f"{scale}× — тестовый клиент Flask (запуск {child['startup_s']:.2f} с)",
+                child["routes"],
+            )
+            for row in child["routes"]:
+                report["results"].append(dict(row, scale=scale, mode="client"))
+
+            if args.gunicorn:
+                rows = run_gunicorn(dataset, args.requests, args.workers, args.concurrency)
+                print_table(
+                    f"{scale}× — gunicorn, {args.workers} воркера, "
+                    f"{args.concurrency} клиентов",
+                    rows,
+                )
+                for row in rows:
+                    report["results"].append(dict(row, scale=scale, mode="gunicorn"))
+        finally:
+            shutil.rmtree(dataset, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"routes-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты: {output}")
+
+    if args.compare:
+        print_comparison(load_source(args.compare), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк полнотекстового поиска по вики
+
+Размножает записи из pages_data в --scale раз (с уникальными id и
+перемешанными словами описаний), строит индекс и меряет время
+построения, задержку запросов (p50/p95/p99) и инкрементального
+обновления после правки одной записи.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_search.py [--scale 100] [--queries 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import search_index  # noqa: E402
+
+WIKI_FILES = {
+    "organizations.json": "org",
+    "personalities.json": "person",
+    "events.json": "event",
+}
+
+
+def load_items():
+    items = []
+    for filename, item_type in WIKI_FILES.items():
+        with open(os.path.join(ROOT, "pages_data", filename), encoding="utf-8") as f:
+            items.extend((item_type, item) for item in json.load(f))
+    return items
+
+
+def build_documents(items, scale, rng):
+    documents = {}
+    for copy in range(scale):
+        for item_type, item in items:
+            item_id = f"{item.get('id')}-{copy}"
+            fields = {field: item.get(field) for field in search_index.FIELD_WEIGHTS}
+            if copy and fields["description"]:
+                words = str(fields["description"]).split()
+                rng.shuffle(words)
+                fields["description"] = " ".join(words)
+            if copy:
+                fields["name"] = f"{item.get('name') or ''} {copy}"
+            meta = {"type": item_type, "id": item_id, "name": fields["name"]}
+            documents[(item_type, item_id)] = (fields, meta)
+    return documents
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = build_documents(load_items(), args.scale, rng)
+
+    index = search_index.SearchIndex()
+    started = time.perf_counter()
+    index.sync(documents)
+    build_time = time.perf_counter() - started
+    print(
+        f"Документов: {len(index)}, слов в словаре: {len(index._tokens)}, "
+        f"построение: {build_time * 1000:.1f} мс"
+    )
+
+    # Запросы — префиксы реальных слов разной длины, как при наборе
+    vocabulary = [t for t in index._tokens if len(t) >= 3 and not t.isdigit()]
+    queries = []
+    for _ in range(args.queries):
+        words = rng.sample(vocabulary, rng.choice((1, 1, 2)))
+        last = words[-1]
+        words[-1] = last[: rng.randint(2, len(last))]
+        queries.append(" ".join(words))
+
+    latencies = []
+    hits = 0
+    for query in queries:
+        started = time.perf_counter()
+        hits += bool(index.search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(f"\nЗапросов: {len(queries)}, с результатами: {hits}")
+    for p in (50, 95, 99):
+        print(f"  p{p}: {percentile(latencies, p):.3f} мс")
+    print(f"  max: {max(latencies):.3f} мс")
+
+    # Правка одной записи, как при сохранении в админке
+    key = next(iter(documents))
+    fields, meta = documents[key]
+    documents[key] = (dict(fields, description="Новое описание после правки"), meta)
+    started = time.perf_counter()
+    changed = index.sync(documents)
+    print(
+        f"\nИнкрементальное обновление ({changed} запись): "
+        f"{(time.perf_counter() - started) * 1000:.2f} мс"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,23 +7,36 @@ Discord Bot для мониторинга серверов и сбора ста
 
 import discord
 from discord.ext import commands, tasks
+import asyncio
+import contextvars
+import functools
+import hashlib
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from collections import defaultdict
 from dotenv import load_dotenv
 
+import history_store
+import live_channel
+import sqlite_storage
+import tick_trace
+from tick_trace import span
+
 # ===== НАСТРОЙКИ =====
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, "servers")
-ASSETS_DIR = os.path.join(BASE_DIR, "servers", "assets")
+DATA_DIR = os.getenv("SERVERS_DATA_DIR", os.path.join(BASE_DIR, "servers"))
+ASSETS_DIR = os.path.join(DATA_DIR, "assets")
+HISTORY_DIR = os.path.join(DATA_DIR, "history")
 
 # Создаём папки
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(ASSETS_DIR, exist_ok=True)
+os.makedirs(HISTORY_DIR, exist_ok=True)
 
 # ===== БОТ =====
 intents = discord.Intents.default()
@@ -38,34 +51,165 @@ bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
 servers_data = {}
 last_update = {}
 
+# Состояние, которое поддерживается событиями gateway между полными
+# пересканированиями: участники (id → запись) и число онлайн по серверам
+guild_members = {}
+online_counts = {}
+# Серверы, чьи данные изменились и должны быть сохранены на ближайшем тике
+dirty_guilds = set()
+
+# Как часто делать полное пересканирование участников (страховка от
+# пропущенных событий, например при переподключении к gateway)
+FULL_RESYNC_MINUTES = int(os.getenv("FULL_RESYNC_MINUTES", "60"))
+last_full_resync = 0.0
+resync_task = None
+
+# Параллельное обновление серверов: сколько одновременно и сколько ждать один
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "8"))
+REFRESH_TIMEOUT = float(os.getenv("REFRESH_TIMEOUT", "30"))
+refresh_semaphore = None  # создаётся внутри работающего event loop
+
+# Период тика
+TICK_SECONDS = 60
+
+# Трассировка тиков: статус в файле (не в servers/ — его читает сайт),
+# медленные тики и пересканирования — в лог
+BOT_STATUS_PATH = os.getenv("BOT_STATUS_PATH", os.path.join(BASE_DIR, "cache", "bot_status.json"))
+SLOW_TICK_SECONDS = float(os.getenv("SLOW_TICK_SECONDS", "10"))
+SLOW_RESYNC_SECONDS = float(os.getenv("SLOW_RESYNC_SECONDS", "300"))
+LOOP_LAG_WARN_SECONDS = float(os.getenv("LOOP_LAG_WARN_SECONDS", "1"))
+tick_monitor = tick_trace.TickMonitor(BOT_STATUS_PATH, SLOW_TICK_SECONDS, LOOP_LAG_WARN_SECONDS)
+
+# Канал живых счётчиков для сайта (см. live_channel.py): путь к сокету
+# и как часто рассылать изменения
+LIVE_SOCKET_PATH = os.getenv("LIVE_SOCKET_PATH", os.path.join(BASE_DIR, "cache", "live.sock"))
+LIVE_PUSH_INTERVAL = float(os.getenv("LIVE_PUSH_INTERVAL", "2"))
+
+# Поминутная история и её агрегаты (15 мин / час / сутки)
+history_writer = history_store.HistoryWriter(HISTORY_DIR)
+
+# Необязательное SQLite-хранилище вместо JSON-файлов (STORAGE_BACKEND=sqlite)
+storage = sqlite_storage.Storage() if sqlite_storage.enabled() else None
+
+# Запись JSON идёт в отдельном потоке, чтобы не блокировать event loop
+# (и heartbeat gateway). Один поток — записи одного сервера не обгоняют друг друга
+persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist")
+# guild_id → sha1 последнего записанного содержимого
+saved_hashes = {}
+# Точки истории тика для SQLite (guild_id, время, участники, онлайн): пишутся
+# одной транзакцией в persist_executor — ожидание блокировки базы не должно
+# останавливать event loop
+history_batch = []
+# guild_id → {member_id: (запись, её JSON)}; используется только потоком записи
+member_json_cache = {}
+# (guild_id, "icon"/"banner") → имя актуального файла в servers/assets
+asset_files = {}
+# Прежние версии ассетов удаляются не сразу: страницы сайта ссылаются на
+# них, пока не записан новый JSON сервера и воркеры его не перечитали.
+# Оба словаря ведёт только поток записи: guild_id → новые файлы, ещё не
+# попавшие в записанный документ, и guild_id → (срок, имена, которые оставить)
+ASSET_GRACE_SECONDS = float(os.getenv("ASSET_GRACE_SECONDS", "300"))
+assets_pending = {}
+assets_cleanup = {}
+
 # ===== ФУНКЦИИ =====
+def is_online(status):
+    """Статус может быть как discord.Status, так и строкой из JSON"""
+    return str(status) != str(discord.Status.offline)
+
+def serialize_member(member: discord.Member):
+    """Запись участника в том виде, в каком она хранится в JSON"""
+    return {
+        "id": str(member.id),
+        "name": member.display_name,
+        "bot": member.bot,
+        "status": str(member.status),
+        "joined_at": member.joined_at.timestamp() if member.joined_at else None
+    }
+
+def store_asset(guild_id, kind, filename, data):
+    """Атомарно записывает файл ассета (в потоке). Прежние версии удалит
+    cleanup_assets, когда новое имя будет в записанном документе"""
+    write_file_atomic(os.path.join(ASSETS_DIR, filename), data)
+    assets_pending.setdefault(guild_id, set()).add(filename)
+
+def schedule_asset_cleanup(guild_id, info):
+    """Документ с новыми именами ассетов записан — прежние версии можно
+    удалить через ASSET_GRACE_SECONDS (в потоке записи)"""
+    pending = assets_pending.get(guild_id)
+    if not pending:
+        return
+    keep = {
+        url.rsplit("/", 1)[-1]
+        for url in (info.get("icon_url"), info.get("banner_url"))
+        if url
+    }
+    pending -= keep
+    if pending:
+        return  # документ собран до скачивания — ждём следующей записи
+    del assets_pending[guild_id]
+    assets_cleanup[guild_id] = (time.monotonic() + ASSET_GRACE_SECONDS, keep)
+
+def cleanup_assets():
+    """Удаляет прежние версии ассетов, срок которых вышел (в потоке записи)"""
+    now = time.monotonic()
+    for guild_id, (due, keep) in list(assets_cleanup.items()):
+        if due > now:
+            continue
+        del assets_cleanup[guild_id]
+        if guild_id in assets_pending:
+            continue  # скачан ещё более новый файл — перенесётся при его записи
+        for kind in ("icon", "banner"):
+            prefix = f"{guild_id}_{kind}"
+            for entry in os.scandir(ASSETS_DIR):
+                if entry.name in keep or not entry.name.startswith(prefix):
+                    continue
+                # Старый файл без хэша (<id>_icon.png) или с прежним хэшем
+                if entry.name == f"{prefix}.png" or entry.name.startswith(f"{prefix}_"):
+                    try:
+                        os.remove(entry.path)
+                    except OSError as e:
+                        print(f"Не удалось удалить {entry.name}: {e}")
+
+async def sync_guild_asset(guild_id, kind, asset):
+    """
+    Возвращает имя файла иконки/баннера вида <id>_<kind>_<hash>.png.
+    Скачивает только при смене хэша Discord; запрос идёт через HTTP-клиент
+    бота (общая сессия aiohttp), запись — вне event loop
+    """
+    if asset is None:
+        asset_files.pop((guild_id, kind), None)
+        return None
+
+    filename = f"{guild_id}_{kind}_{asset.key}.png"
+    if asset_files.get((guild_id, kind)) == filename:
+        return filename
+    if os.path.exists(os.path.join(ASSETS_DIR, filename)):
+        asset_files[(guild_id, kind)] = filename
+        return filename
+
+    try:
+        data = await asset.with_format("png").read()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(persist_executor, store_asset, guild_id, kind, filename, data)
+    except Exception as e:
+        print(f"Ошибка загрузки {kind} сервера {guild_id}: {e}")
+        # Оставляем прежний файл, если он был
+        return asset_files.get((guild_id, kind))
+
+    asset_files[(guild_id, kind)] = filename
+    return filename
+
 async def fetch_server_info(guild: discord.Guild):
-    """Получает информацию о сервере и участников"""
+    """Получает информацию о сервере (без перебора участников)"""
     try:
-        online_count = sum(1 for m in guild.members if m.status != discord.Status.offline)
         guild_id = str(guild.id)
+        online_count = online_counts.get(guild_id, 0)
 
-        # Загрузка аватарки
-        icon_filename = f"{guild_id}_icon.png"
-        icon_path = os.path.join(ASSETS_DIR, icon_filename)
-        if guild.icon and not os.path.exists(icon_path):
-            try:
-                icon_bytes = await guild.icon.read()
-                with open(icon_path, "wb") as f:
-                    f.write(icon_bytes)
-            except Exception as e:
-                print(f"Ошибка загрузки аватарки {guild.name}: {e}")
-
-        # Загрузка баннера
-        banner_filename = f"{guild_id}_banner.png"
-        banner_path = os.path.join(ASSETS_DIR, banner_filename)
-        if guild.banner and not os.path.exists(banner_path):
-            try:
-                banner_bytes = await guild.banner.read()
-                with open(banner_path, "wb") as f:
-                    f.write(banner_bytes)
-            except Exception as e:
-                print(f"Ошибка загрузки баннера {guild.name}: {e}")
+        # Аватарка и баннер: скачиваются заново только при смене хэша
+        with span("assets", guild_id):
+            icon_filename = await sync_guild_asset(guild_id, "icon", guild.icon)
+            banner_filename = await sync_guild_asset(guild_id, "banner", guild.banner)
 
         premium_tier = guild.premium_tier
         premium_subscription_count = guild.premium_subscription_count or 0
@@ -77,8 +221,10 @@ async def fetch_server_info(guild: discord.Guild):
             "online_count": online_count,
             "description": guild.description or "Нет описания",
             "created_at": guild.created_at.timestamp() if guild.created_at else None,
-            "icon_url": f"assets/{icon_filename}" if os.path.exists(icon_path) else None,
-            "banner_url": f"assets/{banner_filename}" if os.path.exists(banner_path) else None,
+            "icon_url": f"assets/{icon_filename}" if icon_filename else None,
+            "icon_hash": guild.icon.key if icon_filename else None,
+            "banner_url": f"assets/{banner_filename}" if banner_filename else None,
+            "banner_hash": guild.banner.key if banner_filename else None,
             "owner_id": str(guild.owner_id) if guild.owner else None,
             "premium_tier": premium_tier,
             "premium_subscription_count": premium_subscription_count,
@@ -91,105 +237,445 @@ async def fetch_server_info(guild: discord.Guild):
             "vanity_url": guild.vanity_url_code,
         })
 
-        members = []
-        for member in guild.members:
-            members.append({
-                "id": str(member.id),
-                "name": member.display_name,
-                "bot": member.bot,
-                "status": str(member.status),
-                "joined_at": member.joined_at.timestamp() if member.joined_at else None
-            })
-
-        return info, members
+        return info
     except Exception as e:
         print(f"Ошибка получения данных {guild.name}: {e}")
-        return None, []
+        return None
 
-def analyze_member_overlaps(current_guild_id, current_members):
-    """Анализирует пересечения участников"""
-    overlaps = {}
-    current_member_ids = {m["id"] for m in current_members if not m.get("bot", False)}
+# ===== ПЕРЕСЕЧЕНИЯ УЧАСТНИКОВ =====
+# Инвертированный индекс: участник → серверы и сервер → участники (без ботов),
+# плюс попарные счётчики общих участников. Индекс обновляется по разнице
+# между прошлым и текущим составом, поэтому работа за тик пропорциональна
+# числу вошедших и вышедших, а не размеру всех серверов
+member_guilds = defaultdict(set)
+guild_member_ids = defaultdict(set)
+overlap_counts = defaultdict(dict)
 
-    for other_guild_id, other_data in servers_data.items():
-        if other_guild_id == current_guild_id:
-            continue
-        other_members = other_data.get("members", [])
-        other_member_ids = {m["id"] for m in other_members if not m.get("bot", False)}
-        common_members = current_member_ids & other_member_ids
-        if common_members:
-            other_info = other_data.get("info", {})
-            overlaps[other_guild_id] = {
-                "server_name": other_info.get("name", "Unknown"),
-                "common_count": len(common_members),
-                "common_member_ids": list(common_members)
-            }
+def _decrement_overlap(guild_id, other_guild_id):
+    counts = overlap_counts[guild_id]
+    counts[other_guild_id] -= 1
+    if counts[other_guild_id] <= 0:
+        del counts[other_guild_id]
+
+def index_add_member(guild_id, member_id):
+    """Добавляет участника сервера в индекс пересечений"""
+    guilds = member_guilds[member_id]
+    if guild_id in guilds:
+        return
+    for other_guild_id in guilds:
+        counts = overlap_counts[guild_id]
+        counts[other_guild_id] = counts.get(other_guild_id, 0) + 1
+        other_counts = overlap_counts[other_guild_id]
+        other_counts[guild_id] = other_counts.get(guild_id, 0) + 1
+    guilds.add(guild_id)
+    guild_member_ids[guild_id].add(member_id)
+
+def index_remove_member(guild_id, member_id):
+    """Убирает участника сервера из индекса пересечений"""
+    guilds = member_guilds.get(member_id)
+    if not guilds or guild_id not in guilds:
+        return
+    guilds.discard(guild_id)
+    guild_member_ids[guild_id].discard(member_id)
+    for other_guild_id in guilds:
+        _decrement_overlap(guild_id, other_guild_id)
+        _decrement_overlap(other_guild_id, guild_id)
+    if not guilds:
+        del member_guilds[member_id]
+
+def update_member_index(guild_id, members):
+    """Применяет к индексу разницу между прошлым и текущим составом сервера.
+    Возвращает id участников, которые вошли или вышли"""
+    current = {m["id"] for m in members if not m.get("bot", False)}
+    previous = guild_member_ids[guild_id]
+    removed = previous - current
+    added = current - previous
+
+    for member_id in removed:
+        index_remove_member(guild_id, member_id)
+    for member_id in added:
+        index_add_member(guild_id, member_id)
+    return removed | added
+
+def analyze_member_overlaps(current_guild_id):
+    """Возвращает пересечения участников сервера с остальными серверами"""
+    overlaps = {}
+    for other_guild_id, common_count in overlap_counts[current_guild_id].items():
+        other_info = servers_data.get(other_guild_id, {}).get("info", {})
+        overlaps[other_guild_id] = {
+            "server_name": other_info.get("name", "Unknown"),
+            "common_count": common_count,
+        }
     return overlaps
 
-async def update_server_data(guild: discord.Guild):
-    """Обновляет данные одного сервера"""
-    info, members = await fetch_server_info(guild)
-    if not info:
+def live_guild_stats():
+    """Текущие счётчики и info серверов для канала живых счётчиков.
+    Онлайн и число участников берутся из состояния, которое ведут события,
+    а не из info, обновляемого раз в тик"""
+    stats = {}
+    for guild_id, data in servers_data.items():
+        info = data["info"]
+        fields = {key: info.get(key) for key in live_channel.LIVE_FIELDS}
+        members = guild_members.get(guild_id)
+        if members is not None:
+            fields["member_count"] = len(members)
+        fields["online_count"] = online_counts.get(guild_id, info.get("online_count"))
+        stats[guild_id] = fields
+    return stats
+
+live_publisher = live_channel.LivePublisher(LIVE_SOCKET_PATH, live_guild_stats, LIVE_PUSH_INTERVAL)
+
+def mark_overlaps_dirty(member_id):
+    """Помечает серверы участника: у них изменились счётчики пересечений"""
+    dirty_guilds.update(member_guilds.get(member_id, ()))
+
+def build_guild_document(guild_id):
+    """Собирает JSON-документ сервера из текущего состояния. Записи участников
+    не меняются на месте (события заменяют их целиком), поэтому снимок можно
+    сериализовать в другом потоке. Большой список участников идёт последним:
+    сайту для страниц хватает начала файла"""
+    data = servers_data[guild_id]
+    return {
+        "info": dict(data["info"]),
+        "member_overlaps": analyze_member_overlaps(guild_id),
+        "members": list(guild_members.get(guild_id, {}).values()),
+    }
+
+def write_file_atomic(path, payload):
+    """Пишет во временный файл и переименовывает: читатель не увидит обрезанный файл"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+def encode_guild_document(guild_id, document):
+    """
+    То же, что json.dumps(document), но JSON неизменившихся участников
+    берётся из member_json_cache. Один json.dumps всего документа держит
+    GIL до конца (на больших серверах — сотни мс) и останавливает event
+    loop, даже работая в другом потоке. Здесь большая часть работы — склейка
+    строк, а новые записи сериализуются по одной: между ними поток
+    отдаёт GIL event loop'у
+    """
+    cached = member_json_cache.get(guild_id, {})
+    fresh = {}
+    for record in document["members"]:
+        entry = cached.get(record["id"])
+        # Записи заменяются целиком: обычно хватает проверки идентичности,
+        # после пересканирования записи новые, но чаще всего равные
+        if entry is None or (entry[0] is not record and entry[0] != record):
+            entry = (record, json.dumps(record, ensure_ascii=False))
+        fresh[record["id"]] = entry
+    member_json_cache[guild_id] = fresh
+
+    head = json.dumps(
+        {"info": document["info"], "member_overlaps": document["member_overlaps"]},
+        ensure_ascii=False,
+    )
+    members = ", ".join(entry[1] for entry in fresh.values())
+    return f'{head[:-1]}, "members": [{members}]}}'.encode("utf-8")
+
+def write_documents(documents, previous_hashes):
+    """Сериализует и записывает документы (выполняется в persist_executor).
+    Возвращает новые хэши; неизменившиеся файлы не перезаписываются"""
+    hashes = {}
+    for guild_id, document in documents.items():
+        with span("serialize", guild_id):
+            payload = encode_guild_document(guild_id, document)
+            digest = hashlib.sha1(payload).hexdigest()
+        if digest != previous_hashes.get(guild_id):
+            with span("write", guild_id):
+                if storage is not None:
+                    storage.save_guild(guild_id, document)
+                else:
+                    write_file_atomic(os.path.join(DATA_DIR, f"{guild_id}.json"), payload)
+        schedule_asset_cleanup(guild_id, document["info"])
+        hashes[guild_id] = digest
+    cleanup_assets()
+    return hashes
+
+def write_history_batch(rows):
+    with span("history"):
+        storage.append_history_rows(rows)
+
+async def persist_history_batch():
+    """Записывает накопленные за тик точки истории в базу (в потоке записи)"""
+    if not history_batch:
+        return
+    rows = history_batch[:]
+    history_batch.clear()
+    loop = asyncio.get_running_loop()
+    write = functools.partial(contextvars.copy_context().run, write_history_batch, rows)
+    try:
+        await loop.run_in_executor(persist_executor, write)
+    except Exception as e:
+        print(f"Ошибка записи истории: {e}")
+        history_batch[:0] = rows  # повторим на следующем тике
+
+async def persist_dirty_guilds():
+    """Сохраняет все изменённые за тик серверы — по одной записи на сервер"""
+    guild_ids = [guild_id for guild_id in dirty_guilds if guild_id in servers_data]
+    dirty_guilds.clear()
+    if not guild_ids:
         return
 
+    # Снимок собирается в event loop, сериализация и запись — в потоке
+    documents = {}
+    for guild_id in guild_ids:
+        with span("document", guild_id):
+            documents[guild_id] = build_guild_document(guild_id)
+    previous = {guild_id: saved_hashes.get(guild_id) for guild_id in guild_ids}
+    loop = asyncio.get_running_loop()
+    # Спаны из потока записи попадают в текущую операцию
+    write = functools.partial(
+        contextvars.copy_context().run, write_documents, documents, previous
+    )
+    try:
+        with span("persist"):
+            hashes = await loop.run_in_executor(persist_executor, write)
+    except Exception as e:
+        print(f"Ошибка сохранения серверов: {e}")
+        dirty_guilds.update(guild_ids)
+        return
+    saved_hashes.update(hashes)
+
+async def update_server_data(guild: discord.Guild):
+    """Полностью пересканирует участников одного сервера"""
     guild_id = str(guild.id)
-    current_time = time.time()
+    members = {}
+    online_count = 0
+    with span("members", guild_id):
+        for member in guild.members:
+            members[str(member.id)] = serialize_member(member)
+            if is_online(member.status):
+                online_count += 1
 
-    if guild_id not in servers_data:
-        servers_data[guild_id] = {"info": info, "history": [], "members": members}
+    guild_members[guild_id] = members
+    online_counts[guild_id] = online_count
 
-    servers_data[guild_id]["history"].append({
-        "timestamp": current_time,
-        "member_count": info["member_count"],
-        "online_count": info["online_count"]
-    })
+    info = await fetch_server_info(guild)
+    if not info:
+        return
+
+    if guild_id not in servers_data:
+        servers_data[guild_id] = {"info": info}
+        migrate_json_history(guild_id)
     servers_data[guild_id]["info"] = info
-    servers_data[guild_id]["members"] = members
-    last_update[guild_id] = current_time
 
-    # Сохраняем в JSON
-    json_file = os.path.join(DATA_DIR, f"{guild_id}.json")
-    with open(json_file, "w", encoding="utf-8") as f:
-        json.dump(servers_data[guild_id], f, ensure_ascii=False, indent=2)
+    with span("overlaps", guild_id):
+        for member_id in update_member_index(guild_id, members.values()):
+            mark_overlaps_dirty(member_id)
+    dirty_guilds.add(guild_id)
 
     print(f"Обновлено: {guild.name}")
 
-@tasks.loop(minutes=1)
+def migrate_json_history(guild_id):
+    """Переносит массив "history" из старого JSON сервера в servers/history/"""
+    if storage is not None:
+        return  # в базу историю переносит `python sqlite_storage.py import`
+    json_file = os.path.join(DATA_DIR, f"{guild_id}.json")
+    try:
+        with open(json_file, "r", encoding="utf-8") as f:
+            history = json.load(f).get("history") or []
+    except (OSError, ValueError):
+        return
+    imported = history_store.import_json_history(HISTORY_DIR, guild_id, history)
+    if imported:
+        history_writer.rebuild(guild_id)
+        print(f"История {guild_id}: перенесено точек — {imported}")
+
+def record_history_point(guild: discord.Guild, current_time):
+    """Дописывает точку истории по счётчикам, которые поддерживают события"""
+    guild_id = str(guild.id)
+    data = servers_data.get(guild_id)
+    if data is None:
+        return
+
+    info = data["info"]
+    member_count = guild.member_count
+    if member_count is None:
+        return  # сервер ещё не загружен — пропуск лучше ложного нуля в истории
+    online_count = online_counts.get(guild_id, 0)
+    if storage is not None:
+        history_batch.append((guild_id, current_time, member_count, online_count))
+    else:
+        with span("history", guild_id):
+            history_writer.append(guild_id, current_time, member_count, online_count)
+    last_update[guild_id] = current_time
+
+    # JSON перезаписываем, только если счётчики действительно изменились
+    if info["member_count"] != member_count or info["online_count"] != online_count:
+        info["member_count"] = member_count
+        info["online_count"] = online_count
+        dirty_guilds.add(guild_id)
+
+async def refresh_guild(guild: discord.Guild):
+    """Полное обновление сервера с ограничением параллельности и таймаутом"""
+    global refresh_semaphore
+
+    if refresh_semaphore is None:
+        refresh_semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+    async with refresh_semaphore:
+        try:
+            await asyncio.wait_for(update_server_data(guild), REFRESH_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Таймаут обновления {guild.name} ({REFRESH_TIMEOUT:.0f} с), пропускаю")
+
+async def refresh_guilds(guilds):
+    """Обновляет серверы параллельно: медленный сервер не задерживает остальные"""
+    results = await asyncio.gather(*(refresh_guild(g) for g in guilds), return_exceptions=True)
+    for guild, result in zip(guilds, results):
+        if isinstance(result, Exception):
+            print(f"Ошибка обновления {guild.name}: {result}")
+
+async def full_resync():
+    """Пересканирует все серверы и чистит устаревшую историю"""
+    global last_full_resync
+
+    started = time.time()
+    guilds = list(bot.guilds)
+    with tick_monitor.operation("resync", SLOW_RESYNC_SECONDS):
+        with span("refresh"):
+            await refresh_guilds(guilds)
+        if storage is None:
+            for guild in guilds:
+                with span("compact", str(guild.id)):
+                    history_writer.compact(str(guild.id), started)
+    last_full_resync = started
+
+@tasks.loop(seconds=TICK_SECONDS)
 async def auto_update():
-    """Автоматическое обновление каждую минуту"""
-    for guild in bot.guilds:
-        await update_server_data(guild)
+    """Каждую минуту: точки истории, сохранение изменённых серверов
+    и (редко) полное пересканирование в фоне"""
+    global resync_task
 
-    # Пересчёт пересечений
-    for guild_id, data in servers_data.items():
-        members = data.get("members", [])
-        servers_data[guild_id]["member_overlaps"] = analyze_member_overlaps(guild_id, members)
-        json_file = os.path.join(DATA_DIR, f"{guild_id}.json")
-        with open(json_file, "w", encoding="utf-8") as f:
-            json.dump(servers_data[guild_id], f, ensure_ascii=False, indent=2)
+    started = time.monotonic()
+    # tasks.loop планирует тики как «плановое время прошлого + TICK_SECONDS»,
+    # поэтому после тика дольше периода догоняющие запуски идут подряд.
+    # Пропускаем только тот, что опоздал к своему плановому времени на
+    # целый период; обычный тик после долгого (30–60 с) выполняется
+    next_iteration = auto_update.next_iteration
+    if next_iteration is not None:
+        late = (discord.utils.utcnow() - next_iteration).total_seconds() + TICK_SECONDS
+        if late >= TICK_SECONDS:
+            print(f"Тик опоздал на {late:.1f} с — пропускаю догоняющий запуск")
+            return
+
+    current_time = time.time()
+    if current_time - last_full_resync >= FULL_RESYNC_MINUTES * 60:
+        if resync_task is None or resync_task.done():
+            # Пересканирование идёт в фоне со своей трассой (см. full_resync)
+            resync_task = asyncio.create_task(full_resync())
+
+    with tick_monitor.operation("tick"):
+        for guild in bot.guilds:
+            record_history_point(guild, current_time)
+        await persist_history_batch()
+
+        # Сохраняем только то, что изменилось с прошлого тика
+        await persist_dirty_guilds()
+
+    duration = time.monotonic() - started
+    if duration > TICK_SECONDS:
+        print(f"Тик занял {duration:.1f} с — дольше интервала")
 
 # ===== СОБЫТИЯ =====
 @bot.event
 async def on_ready():
+    global last_full_resync
+
     print(f"Бот запущен: {bot.user} ({bot.user.id})")
     print(f"Серверов: {len(bot.guilds)}")
+    tick_monitor.start_lag_sampler()
+    await live_publisher.start()
 
     # Первое обновление
-    for guild in bot.guilds:
-        await update_server_data(guild)
+    with tick_monitor.operation("startup", SLOW_RESYNC_SECONDS):
+        with span("refresh"):
+            await refresh_guilds(list(bot.guilds))
+    last_full_resync = time.time()
 
-    # Пересчёт пересечений
-    for guild_id, data in servers_data.items():
-        members = data.get("members", [])
-        servers_data[guild_id]["member_overlaps"] = analyze_member_overlaps(guild_id, members)
-
-    auto_update.start()
-    print("Автообновление запущено")
+    if not auto_update.is_running():
+        auto_update.start()
+        print("Автообновление запущено")
 
 @bot.event
 async def on_guild_join(guild):
     print(f"Добавлен на сервер: {guild.name}")
-    await update_server_data(guild)
+    await refresh_guild(guild)
+
+@bot.event
+async def on_guild_update(before, after):
+    guild_id = str(after.id)
+    if guild_id not in servers_data:
+        return
+    info = await fetch_server_info(after)
+    if not info:
+        return
+    servers_data[guild_id]["info"] = info
+    dirty_guilds.add(guild_id)
+    # Название сервера хранится в пересечениях у соседей
+    if before.name != after.name:
+        dirty_guilds.update(overlap_counts[guild_id])
+
+@bot.event
+async def on_member_join(member):
+    guild_id = str(member.guild.id)
+    members = guild_members.get(guild_id)
+    if members is None:
+        return  # сервер ещё не просканирован
+
+    member_id = str(member.id)
+    members[member_id] = serialize_member(member)
+    if is_online(member.status):
+        online_counts[guild_id] += 1
+    if not member.bot:
+        index_add_member(guild_id, member_id)
+        mark_overlaps_dirty(member_id)
+    dirty_guilds.add(guild_id)
+
+@bot.event
+async def on_member_remove(member):
+    guild_id = str(member.guild.id)
+    members = guild_members.get(guild_id)
+    if members is None:
+        return
+
+    member_id = str(member.id)
+    record = members.pop(member_id, None)
+    if record is None:
+        return
+    if is_online(record["status"]):
+        online_counts[guild_id] -= 1
+    if not record["bot"]:
+        mark_overlaps_dirty(member_id)
+        index_remove_member(guild_id, member_id)
+    dirty_guilds.add(guild_id)
+
+@bot.event
+async def on_presence_update(before, after):
+    guild_id = str(after.guild.id)
+    members = guild_members.get(guild_id)
+    record = members.get(str(after.id)) if members is not None else None
+    if record is None or record["status"] == str(after.status):
+        return
+
+    if is_online(record["status"]) != is_online(after.status):
+        online_counts[guild_id] += 1 if is_online(after.status) else -1
+    members[record["id"]] = serialize_member(after)
+    dirty_guilds.add(guild_id)
+
+@bot.event
+async def on_member_update(before, after):
+    # Ник хранится в списке участников
+    guild_id = str(after.guild.id)
+    members = guild_members.get(guild_id)
+    member_id = str(after.id)
+    if members is None or member_id not in members:
+        return
+    if members[member_id]["name"] != after.display_name:
+        members[member_id] = serialize_member(after)
+        dirty_guilds.add(guild_id)
 
 # ===== ЗАПУСК =====
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+"""
+Хранилище данных сайта из pages_data/*.json
+
+Все файлы читаются один раз и отдаются читателям как неизменяемый снимок
+(DataSnapshot): запрос берёт снимок в начале и работает с ним до конца,
+не видя полузаписанных изменений. Запись из админки не трогает текущий
+снимок: список копируется, меняется, сохраняется на диск и публикуется
+новым снимком с увеличенной версией (copy-on-write).
+
+Производные значения (границы слайдеров, списки тегов, превью) считаются
+функциями derivers и пересчитываются только для изменившихся файлов.
+
+Откуда читать и куда писать, решает источник: по умолчанию JSON-файлы
+в каталоге (JsonDirSource), с STORAGE_BACKEND=sqlite — таблица в базе
+(sqlite_storage.SqlitePagesSource)
+"""
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+# version — растёт при каждом изменении; files — имя файла → кортеж записей;
+# derived — имя файла → результат его deriver
+DataSnapshot = namedtuple("DataSnapshot", ["version", "files", "derived"])
+
+
+def write_json_atomic(path, data):
+    """Пишет JSON во временный файл и подменяет им старый"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+class JsonDirSource:
+    """Файлы *.json в каталоге; сигнатура файла — (mtime_ns, size)"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+    def scan(self):
+        """имя файла → сигнатура для всех файлов источника"""
+        signatures = {}
+        for entry in os.scandir(self.data_dir):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            signatures[entry.name] = (st.st_mtime_ns, st.st_size)
+        return signatures
+
+    def load(self, filename):
+        with open(os.path.join(self.data_dir, filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, filename, items):
+        """Сохраняет файл и возвращает его новую сигнатуру"""
+        path = os.path.join(self.data_dir, filename)
+        write_json_atomic(path, items)
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+
+class DataStore:
+    def __init__(self, source, derivers=None):
+        self.source = source
+        self.derivers = derivers or {}
+        self._snapshot = DataSnapshot(0, {}, {})
+        self._signatures = {}  # имя файла → сигнатура прочитанной версии
+        self._listeners = []
+        self._lock = threading.RLock()
+        self.reload_changed()
+
+    def snapshot(self):
+        return self._snapshot
+
+    def get(self, filename):
+        return self._snapshot.files.get(filename, ())
+
+    def derived(self, filename):
+        return self._snapshot.derived.get(filename)
+
+    def subscribe(self, callback):
+        """callback(snapshot, changed_files) вызывается после каждой публикации"""
+        self._listeners.append(callback)
+
+    def _publish(self, updates, removed=()):
+        files = dict(self._snapshot.files)
+        derived = dict(self._snapshot.derived)
+        for filename in removed:
+            files.pop(filename, None)
+            derived.pop(filename, None)
+        for filename, items in updates.items():
+            files[filename] = items
+            if filename in self.derivers:
+                derived[filename] = self.derivers[filename](items)
+
+        snapshot = DataSnapshot(self._snapshot.version + 1, files, derived)
+        self._snapshot = snapshot
+        changed = set(updates) | set(removed)
+        for callback in self._listeners:
+            callback(snapshot, changed)
+        return snapshot
+
+    def reload_changed(self):
+        """
+        Перечитывает файлы, изменённые в обход хранилища (другим процессом
+        или вручную). Возвращает множество изменившихся имён файлов
+        """
+        with self._lock:
+            try:
+                signatures = self.source.scan()
+            except Exception as e:
+                print(f"Ошибка чтения источника pages_data: {e}")
+                return set()
+
+            updates = {}
+            for filename, signature in signatures.items():
+                if self._signatures.get(filename) == signature:
+                    continue
+                try:
+                    items = self.source.load(filename)
+                except (OSError, ValueError) as e:
+                    # Оставляем прежнюю версию до следующей удачной записи
+                    print(f"Ошибка загрузки {filename}: {e}")
+                    continue
+                self._signatures[filename] = signature
+                updates[filename] = tuple(items)
+
+            removed = set(self._snapshot.files) - set(signatures)
+            for filename in removed:
+                self._signatures.pop(filename, None)
+
+            if updates or removed:
+                self._publish(updates, removed)
+            return set(updates) | removed
+
+    def update(self, filename, mutate):
+        """
+        Меняет файл copy-on-write: mutate получает копию списка записей
+        и правит её на месте. Копия сохраняется в источник и публикуется
+        новым снимком. Возвращает результат mutate
+        """
+        with self._lock:
+            items = list(self.get(filename))
+            result = mutate(items)
+            self._signatures[filename] = self.source.save(filename, items)
+            self._publish({filename: tuple(items)})
+            return result
@@ -0,0 +1,386 @@
+"""
+Хранилище истории серверов (участники / онлайн по времени)
+
+История каждого сервера лежит в servers/history/<guild_id>.bin — это
+записи фиксированной длины, которые бот только дописывает в конец файла.
+Точки идут по возрастанию времени, поэтому сайт находит нужный диапазон
+бинарным поиском и читает только его, не загружая весь файл.
+
+Рядом лежат агрегаты (<guild_id>.<tier>.bin) с min/avg/max за 15 минут,
+час и сутки. Они считаются инкрементально при дописывании точек, а старые
+записи каждого уровня периодически вычищаются (см. TIERS)
+"""
+
+import os
+import struct
+
+# timestamp (double), member_count (uint32), online_count (uint32)
+RECORD = struct.Struct("<dII")
+
+# Начало интервала, число точек, min/max/сумма участников, min/max/сумма онлайна
+ROLLUP_RECORD = struct.Struct("<dIIIdIId")
+
+# (имя, шаг в секундах, срок хранения в секундах или None — бессрочно).
+# "raw" — исходные поминутные точки
+TIERS = [
+    ("raw", 60, 48 * 3600),
+    ("15m", 15 * 60, 30 * 86400),
+    ("1h", 3600, 365 * 86400),
+    ("1d", 86400, None),
+]
+ROLLUP_TIERS = [tier for tier in TIERS if tier[0] != "raw"]
+TIER_STEPS = {name: step for name, step, _ in TIERS}
+
+
+def history_path(history_dir, guild_id, tier="raw"):
+    if tier == "raw":
+        return os.path.join(history_dir, f"{guild_id}.bin")
+    return os.path.join(history_dir, f"{guild_id}.{tier}.bin")
+
+
+def append_points(history_dir, guild_id, points):
+    """Дописывает точки (timestamp, member_count, online_count) в конец файла"""
+    if not points:
+        return
+    os.makedirs(history_dir, exist_ok=True)
+    # Счётчик бывает None (сервер ещё не загружен) — в uint32 это 0
+    payload = b"".join(RECORD.pack(t, m or 0, o or 0) for t, m, o in points)
+    with open(history_path(history_dir, guild_id), "ab") as f:
+        f.write(payload)
+
+
+def append_point(history_dir, guild_id, timestamp, member_count, online_count):
+    append_points(history_dir, guild_id, [(timestamp, member_count, online_count)])
+
+
+def _read_timestamp(f, record, index):
+    f.seek(index * record.size)
+    return struct.unpack_from("<d", f.read(8))[0]
+
+
+def _bisect(f, record, count, timestamp, inclusive):
+    """Первый индекс записи с временем >= timestamp (или > при inclusive)"""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        value = _read_timestamp(f, record, mid)
+        if value < timestamp or (inclusive and value == timestamp):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _read_records(path, record, start=None, end=None):
+    """Сырые кортежи записей с временем в [start, end]"""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+
+    with f:
+        # Недописанная запись в конце (бот пишет прямо сейчас) отбрасывается
+        count = os.fstat(f.fileno()).st_size // record.size
+        lo = _bisect(f, record, count, start, False) if start is not None else 0
+        hi = _bisect(f, record, count, end, True) if end is not None else count
+        if hi <= lo:
+            return []
+        f.seek(lo * record.size)
+        data = f.read((hi - lo) * record.size)
+
+    return list(record.iter_unpack(data[: len(data) - len(data) % record.size]))
+
+
+def read_range(history_dir, guild_id, start=None, end=None):
+    """
+    Возвращает точки истории в диапазоне [start, end] как список словарей
+    {"timestamp", "member_count", "online_count"}
+    """
+    return [
+        {"timestamp": t, "member_count": m, "online_count": o}
+        for t, m, o in _read_records(
+            history_path(history_dir, guild_id), RECORD, start, end
+        )
+    ]
+
+
+def read_rollup_range(history_dir, guild_id, tier, start=None, end=None):
+    """
+    Агрегаты уровня tier за [start, end]: member_count/online_count — средние
+    за интервал, плюс *_min и *_max
+    """
+    return [
+        rollup_point(*record)
+        for record in _read_records(
+            history_path(history_dir, guild_id, tier), ROLLUP_RECORD, start, end
+        )
+    ]
+
+
+def read_tier_range(history_dir, guild_id, tier, start=None, end=None):
+    """
+    read_rollup_range плюс интервалы, которых ещё нет в файле агрегатов:
+    открытый интервал живёт только в памяти бота, поэтому он (и всё после
+    последнего записанного интервала) собирается из сырых точек
+    """
+    step = TIER_STEPS[tier]
+    points = read_rollup_range(history_dir, guild_id, tier, start, end)
+    tail_from = points[-1]["timestamp"] + step if points else start
+    if end is not None and tail_from is not None and tail_from > end:
+        return points
+    return points + aggregate_points(read_range(history_dir, guild_id, tail_from, end), step)
+
+
+def aggregate_points(points, step):
+    """Агрегаты по интервалам step из точек read_range (как read_rollup_range)"""
+    buckets = []
+    for point in sorted(points, key=lambda p: p["timestamp"]):
+        t = point["timestamp"]
+        if not buckets or buckets[-1].start != t - t % step:
+            buckets.append(_Bucket(t - t % step))
+        buckets[-1].add(point.get("member_count") or 0, point.get("online_count") or 0)
+    return [rollup_point(*ROLLUP_RECORD.unpack(bucket.pack())) for bucket in buckets]
+
+
+def downsample(points, max_points):
+    """
+    Не больше max_points точек: соседние точки сливаются группами поровну.
+    Среднее — по средним точек группы, min/max — по всей группе
+    """
+    if len(points) <= max_points:
+        return points
+    size = -(-len(points) // max_points)
+    result = []
+    for i in range(0, len(points), size):
+        group = points[i : i + size]
+        merged = {"timestamp": group[0]["timestamp"]}
+        for field in ("member", "online"):
+            values = [p.get(f"{field}_count") or 0 for p in group]
+            merged[f"{field}_count"] = round(sum(values) / len(values), 2)
+            merged[f"{field}_min"] = min(p.get(f"{field}_min", v) for p, v in zip(group, values))
+            merged[f"{field}_max"] = max(p.get(f"{field}_max", v) for p, v in zip(group, values))
+        result.append(merged)
+    return result
+
+
+def rollup_point(t, n, m_min, m_max, m_sum, o_min, o_max, o_sum):
+    """Запись агрегата (поля ROLLUP_RECORD) в виде точки для графика"""
+    return {
+        "timestamp": t,
+        "member_count": round(m_sum / n, 2),
+        "member_min": m_min,
+        "member_max": m_max,
+        "online_count": round(o_sum / n, 2),
+        "online_min": o_min,
+        "online_max": o_max,
+    }
+
+
+def read_rollup_records(history_dir, guild_id, tier):
+    """Все записи агрегатов уровня tier кортежами полей ROLLUP_RECORD"""
+    return _read_records(history_path(history_dir, guild_id, tier), ROLLUP_RECORD)
+
+
+def merge_rollup_records(history_dir, guild_id, tier, records):
+    """
+    Ставит в начало файла агрегатов более старые записи records (экспорт
+    из базы). Где интервалы совпадают, остаётся запись из records: она
+    посчитана по всем точкам, а файл — только по сохранившимся
+    """
+    if not records:
+        return
+    path = history_path(history_dir, guild_id, tier)
+    last = records[-1][0]
+    existing = [r for r in _read_records(path, ROLLUP_RECORD) if r[0] > last]
+    _rewrite(path, b"".join(ROLLUP_RECORD.pack(*r) for r in list(records) + existing))
+
+
+def import_json_history(history_dir, guild_id, history):
+    """
+    Переносит старый массив "history" из JSON сервера в бинарный файл.
+    Ничего не делает, если файл истории уже существует
+    """
+    if os.path.exists(history_path(history_dir, guild_id)):
+        return 0
+    points = sorted(
+        (
+            float(p["timestamp"]),
+            int(p.get("member_count") or 0),
+            int(p.get("online_count") or 0),
+        )
+        for p in history
+        if p.get("timestamp") is not None
+    )
+    append_points(history_dir, guild_id, points)
+    return len(points)
+
+
+class _Bucket:
+    """Незакрытый интервал агрегата"""
+
+    __slots__ = ("start", "count", "m_min", "m_max", "m_sum", "o_min", "o_max", "o_sum")
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.m_min = self.o_min = 2**32 - 1
+        self.m_max = self.o_max = 0
+        self.m_sum = self.o_sum = 0.0
+
+    def add(self, member_count, online_count):
+        self.count += 1
+        self.m_min = min(self.m_min, member_count)
+        self.m_max = max(self.m_max, member_count)
+        self.m_sum += member_count
+        self.o_min = min(self.o_min, online_count)
+        self.o_max = max(self.o_max, online_count)
+        self.o_sum += online_count
+
+    def pack(self):
+        return ROLLUP_RECORD.pack(
+            self.start, self.count,
+            self.m_min, self.m_max, self.m_sum,
+            self.o_min, self.o_max, self.o_sum,
+        )
+
+
+def _last_timestamp(path, record):
+    try:
+        with open(path, "rb") as f:
+            count = os.fstat(f.fileno()).st_size // record.size
+            if not count:
+                return None
+            return _read_timestamp(f, record, count - 1)
+    except FileNotFoundError:
+        return None
+
+
+def _truncate_torn(path, record):
+    """
+    Обрезает недописанную запись в конце файла (падение посреди записи).
+    Иначе следующее дописывание сдвинет все записи после неё
+    """
+    try:
+        with open(path, "r+b") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size % record.size:
+                f.truncate(size - size % record.size)
+                print(f"История: обрезана недописанная запись в {path}")
+    except FileNotFoundError:
+        pass
+
+
+def _rewrite(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class HistoryWriter:
+    """
+    Дописывает точки истории и инкрементально ведёт агрегаты.
+    Незакрытый интервал каждого уровня живёт в памяти и пишется в файл,
+    когда приходит точка из следующего интервала. После перезапуска
+    незакрытые интервалы восстанавливаются из сырых точек (их хранится
+    48 часов — больше самого длинного интервала)
+    """
+
+    def __init__(self, history_dir):
+        self.history_dir = history_dir
+        # guild_id → {tier: _Bucket}
+        self._buckets = {}
+        # guild_id → {tier: начало последнего записанного интервала}
+        self._flushed = {}
+
+    def _load_state(self, guild_id):
+        buckets = {}
+        flushed = {}
+        # Файлы только дописываются — перед первым дописыванием выравниваем их
+        _truncate_torn(history_path(self.history_dir, guild_id), RECORD)
+        last_point = _last_timestamp(history_path(self.history_dir, guild_id), RECORD)
+
+        for name, step, _ in ROLLUP_TIERS:
+            _truncate_torn(history_path(self.history_dir, guild_id, name), ROLLUP_RECORD)
+            flushed[name] = _last_timestamp(
+                history_path(self.history_dir, guild_id, name), ROLLUP_RECORD
+            )
+            if last_point is None:
+                continue
+            bucket = _Bucket(last_point - last_point % step)
+            for _, m, o in _read_records(
+                history_path(self.history_dir, guild_id), RECORD, bucket.start
+            ):
+                bucket.add(m, o)
+            buckets[name] = bucket
+
+        self._buckets[guild_id] = buckets
+        self._flushed[guild_id] = flushed
+
+    def append(self, guild_id, timestamp, member_count, online_count):
+        """Дописывает точку и закрывает завершившиеся интервалы агрегатов"""
+        member_count = member_count or 0
+        online_count = online_count or 0
+        if guild_id not in self._buckets:
+            self._load_state(guild_id)
+        buckets = self._buckets[guild_id]
+        flushed = self._flushed[guild_id]
+
+        # Сначала закрытые интервалы, потом сама точка: при падении между
+        # ними интервал восстановится из сырых точек, а повтор отсечёт flushed
+        for name, step, _ in ROLLUP_TIERS:
+            start = timestamp - timestamp % step
+            bucket = buckets.get(name)
+            if bucket is not None and bucket.start != start:
+                if bucket.count and (flushed[name] is None or bucket.start > flushed[name]):
+                    with open(history_path(self.history_dir, guild_id, name), "ab") as f:
+                        f.write(bucket.pack())
+                    flushed[name] = bucket.start
+                bucket = None
+            if bucket is None:
+                bucket = buckets[name] = _Bucket(start)
+            bucket.add(member_count, online_count)
+
+        append_point(self.history_dir, guild_id, timestamp, member_count, online_count)
+
+    def rebuild(self, guild_id):
+        """Пересчитывает все агрегаты из сырых точек (например, после импорта)"""
+        points = _read_records(history_path(self.history_dir, guild_id), RECORD)
+        for name, step, _ in ROLLUP_TIERS:
+            records = []
+            bucket = None
+            for t, m, o in points:
+                start = t - t % step
+                if bucket is not None and bucket.start != start:
+                    records.append(bucket.pack())
+                    bucket = None
+                if bucket is None:
+                    bucket = _Bucket(start)
+                bucket.add(m, o)
+            # Последний интервал остаётся открытым — его допишет append
+            _rewrite(history_path(self.history_dir, guild_id, name), b"".join(records))
+        self._buckets.pop(guild_id, None)
+        self._flushed.pop(guild_id, None)
+
+    def compact(self, guild_id, now):
+        """
+        Удаляет записи старше срока хранения своего уровня. Файл
+        переписывается, только когда устаревших записей набралось заметно
+        """
+        for name, step, retention in TIERS:
+            if retention is None:
+                continue
+            record = RECORD if name == "raw" else ROLLUP_RECORD
+            path = history_path(self.history_dir, guild_id, name)
+            cutoff = now - retention
+            try:
+                with open(path, "rb") as f:
+                    count = os.fstat(f.fileno()).st_size // record.size
+                    if not count or _read_timestamp(f, record, 0) >= cutoff - retention / 10:
+                        continue
+                    keep_from = _bisect(f, record, count, cutoff, False)
+                    f.seek(keep_from * record.size)
+                    data = f.read((count - keep_from) * record.size)
+            except FileNotFoundError:
+                continue
+            _rewrite(path, data)
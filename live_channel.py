@@ -0,0 +1,241 @@
+"""
+Живые счётчики серверов: канал бот → сайт через Unix-сокет
+
+Бот (LivePublisher) слушает сокет. Новому подключению отправляется
+снимок всех серверов, дальше раз в interval секунд — только изменившиеся
+поля изменившихся серверов (онлайн, участники, название, иконка...).
+Сообщения — JSON по строке:
+
+    {"type": "snapshot", "guilds": {"<id>": {"online_count": 12, ...}}}
+    {"type": "delta", "guilds": {"<id>": {"online_count": 13}}, "removed": []}
+
+Значения в дельтах абсолютные, поэтому лишняя или повторная дельта
+ничего не ломает.
+
+Сайт (LiveView) в каждом воркере держит фоновый поток-клиент и
+собирает из сообщений представление в памяти; SSE-потоки ждут
+изменений на условной переменной. Пока бот не запущен, клиент тихо
+переподключается, а сайт показывает данные из файлов.
+
+На платформах без Unix-сокетов (Windows) канал выключен
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+
+# Поля info, которые бот публикует в канал
+LIVE_FIELDS = (
+    "name",
+    "member_count",
+    "online_count",
+    "premium_tier",
+    "premium_subscription_count",
+    "description",
+    "icon_url",
+    "banner_url",
+)
+
+# Клиент, не успевающий читать (буфер больше этого), отключается —
+# он переподключится и получит свежий снимок
+MAX_CLIENT_BUFFER = 1024 * 1024
+
+RECONNECT_SECONDS = 5
+
+
+def supported():
+    return hasattr(socket, "AF_UNIX")
+
+
+def encode(message):
+    return (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class LivePublisher:
+    """Сторона бота: collect() → {guild_id: {поле: значение}}"""
+
+    def __init__(self, path, collect, interval):
+        self.path = path
+        self.collect = collect
+        self.interval = interval
+        self.clients = set()
+        self.sent = {}  # последнее разосланное состояние
+        self.server = None
+        self.task = None
+
+    async def start(self):
+        """Открывает сокет и запускает рассылку (повторный вызов ничего не делает)"""
+        if self.server is not None or not supported():
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            os.unlink(self.path)  # сокет от прошлого запуска
+        except FileNotFoundError:
+            pass
+        try:
+            self.server = await asyncio.start_unix_server(self._handle, path=self.path)
+        except (OSError, NotImplementedError) as e:
+            print(f"Канал живых счётчиков не открыт: {e}")
+            return
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        print(f"Канал живых счётчиков: {self.path}")
+
+    def _send(self, writer, payload):
+        if writer.is_closing():
+            self.clients.discard(writer)
+            return
+        if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            print("Клиент канала не успевает читать — отключаю")
+            self.clients.discard(writer)
+            writer.close()
+            return
+        writer.write(payload)
+
+    def flush(self):
+        """Рассылает разницу между текущим и последним разосланным состоянием"""
+        current = self.collect()
+        if not self.clients:
+            self.sent = current
+            return
+
+        delta = {}
+        for guild_id, fields in current.items():
+            previous = self.sent.get(guild_id)
+            if previous is None:
+                delta[guild_id] = fields
+                continue
+            changed = {k: v for k, v in fields.items() if previous.get(k) != v}
+            if changed:
+                delta[guild_id] = changed
+        removed = [guild_id for guild_id in self.sent if guild_id not in current]
+        self.sent = current
+
+        if delta or removed:
+            payload = encode({"type": "delta", "guilds": delta, "removed": removed})
+            for writer in list(self.clients):
+                self._send(writer, payload)
+
+    async def _handle(self, reader, writer):
+        # Старые клиенты получают накопившуюся дельту, новый — снимок
+        # того же состояния, так что дальше дельты общие для всех
+        self.flush()
+        self.clients.add(writer)
+        self._send(writer, encode({"type": "snapshot", "guilds": self.sent}))
+        try:
+            await reader.read()  # клиент ничего не пишет — ждём отключения
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.clients:
+                continue  # без слушателей не собираем; снимок соберёт _handle
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Ошибка рассылки живых счётчиков: {e}")
+
+
+class LiveView:
+    """Сторона сайта: представление живых счётчиков в памяти воркера"""
+
+    def __init__(self, path):
+        self.path = path
+        self.guilds = {}  # guild_id → {поле: значение}
+        self.versions = {}  # guild_id → версия последнего изменения
+        self.version = 0
+        self.connected = False
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def start(self):
+        """Запускает поток-клиент в текущем процессе (один раз на процесс)"""
+        if not supported() or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="live-view", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    with sock.makefile("r", encoding="utf-8") as stream:
+                        for line in stream:
+                            self._apply(json.loads(line))
+            except (OSError, ValueError):
+                pass
+            if self.connected:
+                print("Канал живых счётчиков закрыт, переподключаюсь")
+            self._reset()
+            time.sleep(RECONNECT_SECONDS)
+
+    def _reset(self):
+        """Без бота живые данные устаревают — страницы берут данные из файлов"""
+        with self._cond:
+            self.connected = False
+            if self.guilds:
+                self.guilds = {}
+                self.versions = {}
+                self.version += 1
+                self._cond.notify_all()
+
+    def _apply(self, message):
+        with self._cond:
+            version = self.version + 1
+            changed = False
+            if message.get("type") == "snapshot":
+                self.connected = True
+                guilds = message.get("guilds") or {}
+                for guild_id in set(self.guilds) - set(guilds):
+                    del self.guilds[guild_id]
+                    self.versions.pop(guild_id, None)
+                for guild_id, fields in guilds.items():
+                    if self.guilds.get(guild_id) != fields:
+                        self.guilds[guild_id] = fields
+                        self.versions[guild_id] = version
+                        changed = True
+            else:
+                for guild_id in message.get("removed") or ():
+                    self.guilds.pop(guild_id, None)
+                    self.versions.pop(guild_id, None)
+                for guild_id, fields in (message.get("guilds") or {}).items():
+                    self.guilds[guild_id] = dict(self.guilds.get(guild_id) or {}, **fields)
+                    self.versions[guild_id] = version
+                    changed = True
+            if changed:
+                self.version = version
+                self._cond.notify_all()
+
+    def get(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def merge(self, guild_id, info):
+        """info с наложенными живыми значениями (копия, если они есть)"""
+        fields = self.guilds.get(guild_id)
+        return dict(info, **fields) if fields else info
+
+    def wait(self, version, timeout):
+        """Ждёт версию новее version не дольше timeout; возвращает текущую"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def changes_since(self, version, fields, guild_id=None):
+        """(текущая версия, {guild_id: поля}) для серверов, изменённых после version"""
+        with self._cond:
+            if guild_id is not None:
+                ids = [guild_id] if self.versions.get(guild_id, 0) > version else []
+            else:
+                ids = [g for g, v in self.versions.items() if v > version]
+            changes = {
+                g: {k: self.guilds[g][k] for k in fields if k in self.guilds[g]} for g in ids
+            }
+            return self.version, changes
@@ -0,0 +1,277 @@
+"""
+Метрики сайта в формате Prometheus (text exposition 0.0.4)
+
+Счётчики и гистограммы копятся в памяти воркера и не чаще раза в
+flush_interval секунд сбрасываются в свой файл <pid>-<старт>.json
+в общем каталоге. /metrics суммирует файлы всех воркеров, поэтому
+ответ одинаков, какой бы воркер gunicorn его ни обслужил; данные
+других воркеров отстают не больше чем на flush_interval.
+
+Файлы завершившихся воркеров сливаются в archive.json — счётчики
+не уменьшаются при перезапуске воркеров, а каталог не растёт.
+Значения-«датчики» (gauge) не копятся, а вычисляются при запросе
+функциями, переданными в gauge()
+
+Без fcntl (Windows: сайт там один процесс, без gunicorn) общий каталог
+не используется — метрики живут только в памяти процесса
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Границы гистограмм времени по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ARCHIVE_NAME = "archive.json"
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._meta = {}  # имя → (тип, описание, границы гистограммы)
+        self._gauges = {}  # имя → функция, возвращающая {метки: значение}
+        self.shared = fcntl is not None
+        self._reset()
+        if not self.shared:
+            return
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.flush)
+        # Воркер, форкнутый после --preload, начинает со своего файла и нулей,
+        # а накопленное мастером до форка остаётся в файле мастера
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self.flush, after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (имя, метки) → значение
+        self._histograms = {}  # (имя, метки) → [счётчики корзин..., сумма]
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._path = os.path.join(self.directory, f"{os.getpid()}-{time.time_ns()}.json")
+
+    # ---- Объявление метрик
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+
+    def gauge(self, name, help_text, collect):
+        """collect() → {кортеж пар (метка, значение): число}, вызывается при запросе"""
+        self._meta[name] = ("gauge", help_text, None)
+        self._gauges[name] = collect
+
+    # ---- Запись
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._dirty = True
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = (name, self._labels(labels))
+        with self._lock:
+            counts = self._histograms.get(key)
+            if counts is None:
+                counts = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(buckets)] += 1
+            counts[-1] += value
+            self._dirty = True
+
+    @contextmanager
+    def time(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # ---- Общий каталог
+
+    def _dump(self):
+        with self._lock:
+            data = {
+                "counters": [[n, l, v] for (n, l), v in self._counters.items()],
+                "histograms": [[n, l, list(c)] for (n, l), c in self._histograms.items()],
+            }
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        return data
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        if not self.shared or not self._dirty:
+            return
+        try:
+            self._write(self._path, self._dump())
+        except OSError as e:
+            print(f"Ошибка записи метрик: {e}")
+
+    def maybe_flush(self):
+        """Сбрасывает метрики в файл, если прошло flush_interval секунд"""
+        if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _merge(total, data):
+        for name, labels, value in data.get("counters", ()):
+            key = (name, tuple(map(tuple, labels)))
+            total["counters"][key] = total["counters"].get(key, 0) + value
+        for name, labels, counts in data.get("histograms", ()):
+            key = (name, tuple(map(tuple, labels)))
+            current = total["histograms"].get(key)
+            if current is None or len(current) != len(counts):
+                total["histograms"][key] = list(counts)
+            else:
+                total["histograms"][key] = [a + b for a, b in zip(current, counts)]
+
+    @staticmethod
+    def _serialize(total):
+        return {
+            "counters": [[n, l, v] for (n, l), v in total["counters"].items()],
+            "histograms": [[n, l, c] for (n, l), c in total["histograms"].items()],
+        }
+
+    def _collect_files(self):
+        """Сумма файлов всех воркеров; файлы завершившихся переносит в архив"""
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        total = {"counters": {}, "histograms": {}}
+        dead = []
+
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = self._read(archive_path)
+            if archive:
+                self._merge(total, archive)
+
+            for entry in os.scandir(self.directory):
+                name = entry.name
+                if not name.endswith(".json") or name == ARCHIVE_NAME:
+                    continue
+                data = self._read(entry.path)
+                if data is None:
+                    continue
+                self._merge(total, data)
+                pid = name.split("-", 1)[0]
+                if entry.path != self._path and pid.isdigit() and not pid_alive(int(pid)):
+                    dead.append(entry.path)
+
+            if dead:
+                archived = {"counters": {}, "histograms": {}}
+                if archive:
+                    self._merge(archived, archive)
+                for path in dead:
+                    self._merge(archived, self._read(path) or {})
+                self._write(archive_path, self._serialize(archived))
+                for path in dead:
+                    os.remove(path)
+
+        return total
+
+    # ---- Вывод
+
+    def render(self):
+        """Текст для Prometheus по всем воркерам"""
+        if self.shared:
+            self.flush()
+            total = self._collect_files()
+        else:
+            total = {"counters": {}, "histograms": {}}
+            self._merge(total, self._dump())
+
+        series = {}
+        for (name, labels), value in total["counters"].items():
+            series.setdefault(name, []).append((labels, value))
+        for (name, labels), counts in total["histograms"].items():
+            series.setdefault(name, []).append((labels, counts))
+        for name, collect in self._gauges.items():
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Ошибка метрики {name}: {e}")
+                continue
+            series[name] = list(values.items())
+
+        lines = []
+        for name in sorted(self._meta):
+            kind, help_text, buckets = self._meta[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.get(name, ()), key=lambda s: s[0]):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+                if len(value) != len(buckets) + 2:
+                    continue  # границы поменялись между версиями — пропускаем
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), value):
+                    cumulative += count
+                    le = labels + (("le", format_value(float(bound))),)
+                    lines.append(f"{name}_bucket{format_labels(le)} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(value[-1])}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
@@ -4,4 +4,5 @@ echo "🚀 Запускаю Discord-бота..."
 python3 bot.py &
 
 echo "🌐 Запускаю Flask-сайт через Gunicorn..."
-gunicorn -w 2 -b 127.0.0.1:5000 site:app
\ No newline at end of file
+# gthread: потоки живых счётчиков (/servers/stream) не занимают весь воркер
+gunicorn -w 2 -k gthread --threads 32 -b 127.0.0.1:5000 app:app
\ No newline at end of file
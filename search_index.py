@@ -0,0 +1,168 @@
+"""
+Полнотекстовый поиск по вики (организации, личности, ивенты)
+
+Обратный индекс: нормализованное слово → документы, в которых оно
+встречается, с весом поля (название весит больше описания). Слова
+дополнительно хранятся в отсортированном списке, поэтому префикс
+последнего слова запроса (подсказки при наборе) ищется бинарным поиском.
+
+Нормализация учитывает кириллицу: NFKC, casefold и ё → е, так что
+«Ёжик», «ежик» и «ЕЖИК» совпадают
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+
+# Поле документа → вес совпадения в нём
+FIELD_WEIGHTS = {
+    "name": 8,
+    "old_nicknames": 4,
+    "leader": 3,
+    "description": 1,
+}
+
+# Бонус за полное совпадение слова (а не только префикса)
+EXACT_BONUS = 2
+
+# Префиксы короче этого ищутся только как целые слова — иначе одна буква
+# разворачивается в половину словаря
+MIN_PREFIX_LENGTH = 2
+
+TOKEN_RE = re.compile(r"\w+")
+# Ссылки из markdown и голые URL — адреса в индекс не попадают
+MARKDOWN_LINK_RE = re.compile(r"\]\([^)]*\)")
+URL_RE = re.compile(r"https?://\S+")
+
+
+def normalize(text):
+    """Приводит строку к виду, в котором она хранится в индексе"""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return text.replace("ё", "е")
+
+
+def tokenize(text):
+    if not text:
+        return []
+    if isinstance(text, (list, tuple)):
+        text = " ".join(map(str, text))
+    text = URL_RE.sub(" ", MARKDOWN_LINK_RE.sub("] ", str(text)))
+    return TOKEN_RE.findall(normalize(text))
+
+
+class SearchIndex:
+    """
+    Обратный индекс с инкрементальным обновлением. Документ — словарь
+    полей из FIELD_WEIGHTS плюс произвольные данные для выдачи (meta).
+    Чтение и запись защищены блокировкой: админка обновляет индекс,
+    пока другие потоки выполняют поиск
+    """
+
+    def __init__(self):
+        self._postings = {}  # слово → {ключ документа: вес}
+        self._tokens = []  # отсортированные слова для поиска по префиксу
+        self._docs = {}  # ключ → (поля, meta, {слово: вес})
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    @staticmethod
+    def _weights(fields):
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in set(tokenize(fields.get(field))):
+                if weights.get(token, 0) < weight:
+                    weights[token] = weight
+        return weights
+
+    def _add(self, key, fields, meta):
+        weights = self._weights(fields)
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._tokens, token)
+            postings[key] = weight
+        self._docs[key] = (fields, meta, weights)
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for token in doc[2]:
+            postings = self._postings[token]
+            del postings[key]
+            if not postings:
+                del self._postings[token]
+                pos = bisect.bisect_left(self._tokens, token)
+                del self._tokens[pos]
+
+    def sync(self, documents):
+        """
+        Приводит индекс к набору documents ({ключ: (поля, meta)}).
+        Переиндексируются только добавленные, изменённые и удалённые
+        документы. Возвращает число затронутых документов
+        """
+        changed = 0
+        with self._lock:
+            for key in [k for k in self._docs if k not in documents]:
+                self._remove(key)
+                changed += 1
+            for key, (fields, meta) in documents.items():
+                doc = self._docs.get(key)
+                if doc is not None and doc[0] == fields:
+                    if doc[1] != meta:
+                        self._docs[key] = (fields, meta, doc[2])
+                    continue
+                self._remove(key)
+                self._add(key, fields, meta)
+                changed += 1
+        return changed
+
+    def _expand(self, token, prefix):
+        """Слова индекса, совпадающие с token (или начинающиеся с него)"""
+        if not prefix or len(token) < MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+        start = bisect.bisect_left(self._tokens, token)
+        end = bisect.bisect_left(self._tokens, token + "\U0010ffff", start)
+        return self._tokens[start:end]
+
+    def search(self, query, limit=20, doc_filter=None):
+        """
+        Документы, содержащие все слова запроса (последнее — как префикс),
+        по убыванию релевантности: список (score, meta)
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            scores = None
+            for i, token in enumerate(tokens):
+                token_scores = {}
+                for match in self._expand(token, i == len(tokens) - 1):
+                    bonus = EXACT_BONUS if match == token else 1
+                    for key, weight in self._postings[match].items():
+                        score = weight * bonus
+                        if score > token_scores.get(key, 0):
+                            token_scores[key] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        key: score + token_scores[key]
+                        for key, score in scores.items()
+                        if key in token_scores
+                    }
+                if not scores:
+                    return []
+
+            if doc_filter is not None:
+                scores = {k: s for k, s in scores.items() if doc_filter(k)}
+            best = heapq.nsmallest(
+                limit, scores.items(), key=lambda kv: (-kv[1], kv[0])
+            )
+            return [(score, self._docs[key][1]) for key, score in best]
@@ -0,0 +1,85 @@
+"""
+Общее состояние воркеров gunicorn в локальном файле SQLite
+
+Каждый воркер — отдельный процесс со своими данными в памяти. Чтобы
+правка в админке дошла до всех, воркер после записи увеличивает счётчик
+поколения, а остальные сверяют его перед каждым запросом и при отличии
+перечитывают данные. Здесь же лежат сессии админки: токен, выданный
+одним воркером, действителен во всех.
+
+Внешних сервисов не нужно: файл базы лежит рядом с сайтом, доступ из
+разных процессов сериализует сам SQLite (режим WAL)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS admin_sessions (
+    token TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+"""
+
+
+class SharedState:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """Соединение своё у каждого потока и у каждого процесса после fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # ---- Поколения данных
+
+    def generation(self, name):
+        row = self._connect().execute(
+            "SELECT value FROM generations WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, name):
+        """Увеличивает поколение name и возвращает новое значение"""
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO generations (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+        return self.generation(name)
+
+    # ---- Сессии админки
+
+    def add_session(self, token, expires):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO admin_sessions (token, expires) VALUES (?, ?)",
+            (token, expires),
+        )
+        # Заодно чистим истёкшие, чтобы таблица не росла
+        conn.execute("DELETE FROM admin_sessions WHERE expires < ?", (time.time(),))
+
+    def session_expires(self, token):
+        row = self._connect().execute(
+            "SELECT expires FROM admin_sessions WHERE token = ?", (token,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def remove_session(self, token):
+        self._connect().execute("DELETE FROM admin_sessions WHERE token = ?", (token,))
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite-хранилище серверов, участников, истории и страниц вики
+
+Необязательная замена JSON-файлам (servers/*.json, servers/history/,
+pages_data/*.json). Включается переменной STORAGE_BACKEND=sqlite, путь к
+базе — STORAGE_DB. База в режиме WAL: бот пишет, воркеры сайта читают,
+никто никого не блокирует. Сохранение сервера меняет только строки
+изменившихся участников и пересечений, а не весь документ.
+
+История хранится поминутными точками; агрегаты для длинных периодов
+(15 мин / час / сутки) считаются запросом по индексу (guild_id, timestamp).
+Периоды, от которых при переносе остались только агрегаты (в JSON-режиме
+сырые точки старше 48 часов удаляются), лежат готовыми записями в
+history_rollups.
+
+Перенос существующих данных и откат:
+    python sqlite_storage.py import [--db PATH]
+    python sqlite_storage.py export [--db PATH] [--servers DIR] [--pages DIR]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import history_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVERS_DIR = os.getenv("SERVERS_DATA_DIR", os.path.join(BASE_DIR, "servers"))
+PAGES_DIR = os.getenv("PAGES_DATA_DIR", os.path.join(BASE_DIR, "pages_data"))
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+STORAGE_DB = os.getenv("STORAGE_DB", os.path.join(SERVERS_DIR, "storage.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    guild_id TEXT NOT NULL,
+    member_id TEXT NOT NULL,
+    name TEXT,
+    bot INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    joined_at REAL,
+    PRIMARY KEY (guild_id, member_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS members_member_id ON members (member_id);
+CREATE TABLE IF NOT EXISTS overlaps (
+    guild_id TEXT NOT NULL,
+    other_guild_id TEXT NOT NULL,
+    server_name TEXT,
+    common_count INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, other_guild_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history (
+    guild_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    member_count INTEGER NOT NULL,
+    online_count INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, timestamp)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+CREATE TABLE IF NOT EXISTS history_rollups (
+    guild_id TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    bucket REAL NOT NULL,
+    count INTEGER NOT NULL,
+    member_min INTEGER NOT NULL,
+    member_max INTEGER NOT NULL,
+    member_sum REAL NOT NULL,
+    online_min INTEGER NOT NULL,
+    online_max INTEGER NOT NULL,
+    online_sum REAL NOT NULL,
+    PRIMARY KEY (guild_id, step, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS page_files (
+    filename TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    filename TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (filename, position)
+) WITHOUT ROWID;
+"""
+
+
+def enabled():
+    return STORAGE_BACKEND == "sqlite"
+
+
+def dumps(value):
+    # Порядок ключей сохраняется — экспорт возвращает файлы в прежнем виде
+    return json.dumps(value, ensure_ascii=False)
+
+
+class Storage:
+    def __init__(self, path=STORAGE_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """Соединение своё у каждого потока и у каждого процесса после fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---- Серверы
+
+    def guild_versions(self):
+        """guild_id → (updated_ns, version) — сигнатура для перезагрузки"""
+        rows = self._connect().execute(
+            "SELECT guild_id, updated_ns, version FROM guilds"
+        )
+        return {guild_id: (updated_ns, version) for guild_id, updated_ns, version in rows}
+
+    def load_guild_info(self, guild_id):
+        row = self._connect().execute(
+            "SELECT info FROM guilds WHERE guild_id = ?", (guild_id,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def load_guild_section(self, guild_id, section):
+        """Секция документа: "members" или "member_overlaps" (иначе None)"""
+        conn = self._connect()
+        if section == "members":
+            return [
+                {
+                    "id": member_id,
+                    "name": name,
+                    "bot": bool(bot),
+                    "status": status,
+                    "joined_at": joined_at,
+                }
+                for member_id, name, bot, status, joined_at in conn.execute(
+                    "SELECT member_id, name, bot, status, joined_at FROM members "
+                    "WHERE guild_id = ?",
+                    (guild_id,),
+                )
+            ]
+        if section == "member_overlaps":
+            return {
+                other_guild_id: {"server_name": server_name, "common_count": common_count}
+                for other_guild_id, server_name, common_count in conn.execute(
+                    "SELECT other_guild_id, server_name, common_count FROM overlaps "
+                    "WHERE guild_id = ?",
+                    (guild_id,),
+                )
+            }
+        return None
+
+    def load_guild(self, guild_id):
+        """Документ сервера в том же формате, что и servers/<id>.json"""
+        info = self.load_guild_info(guild_id)
+        if info is None:
+            return None
+        return {
+            "info": info,
+            "member_overlaps": self.load_guild_section(guild_id, "member_overlaps"),
+            "members": self.load_guild_section(guild_id, "members"),
+        }
+
+    def save_guild(self, guild_id, document):
+        """
+        Сохраняет документ сервера. Неизменившиеся строки не переписываются;
+        версия растёт, только если что-то действительно поменялось.
+        Возвращает True, если были изменения
+        """
+        members = document.get("members") or []
+        overlaps = document.get("member_overlaps") or {}
+
+        with self._transaction() as conn:
+            before = conn.total_changes
+
+            conn.execute(
+                "INSERT INTO guilds (guild_id, info, updated_ns) VALUES (?, ?, 0) "
+                "ON CONFLICT(guild_id) DO UPDATE SET info = excluded.info "
+                "WHERE info IS NOT excluded.info",
+                (guild_id, dumps(document.get("info") or {})),
+            )
+
+            conn.executemany(
+                "INSERT INTO members (guild_id, member_id, name, bot, status, joined_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(guild_id, member_id) DO UPDATE SET "
+                "name = excluded.name, bot = excluded.bot, "
+                "status = excluded.status, joined_at = excluded.joined_at "
+                "WHERE name IS NOT excluded.name OR bot IS NOT excluded.bot "
+                "OR status IS NOT excluded.status "
+                "OR joined_at IS NOT excluded.joined_at",
+                [
+                    (
+                        guild_id,
+                        str(m["id"]),
+                        m.get("name"),
+                        int(bool(m.get("bot"))),
+                        m.get("status"),
+                        m.get("joined_at"),
+                    )
+                    for m in members
+                ],
+            )
+            current = {str(m["id"]) for m in members}
+            stored = {
+                member_id
+                for (member_id,) in conn.execute(
+                    "SELECT member_id FROM members WHERE guild_id = ?", (guild_id,)
+                )
+            }
+            conn.executemany(
+                "DELETE FROM members WHERE guild_id = ? AND member_id = ?",
+                [(guild_id, member_id) for member_id in stored - current],
+            )
+
+            conn.executemany(
+                "INSERT INTO overlaps (guild_id, other_guild_id, server_name, common_count) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(guild_id, other_guild_id) DO UPDATE SET "
+                "server_name = excluded.server_name, common_count = excluded.common_count "
+                "WHERE server_name IS NOT excluded.server_name "
+                "OR common_count IS NOT excluded.common_count",
+                [
+                    (guild_id, str(other), o.get("server_name"), int(o.get("common_count") or 0))
+                    for other, o in overlaps.items()
+                ],
+            )
+            stored = {
+                other
+                for (other,) in conn.execute(
+                    "SELECT other_guild_id FROM overlaps WHERE guild_id = ?", (guild_id,)
+                )
+            }
+            conn.executemany(
+                "DELETE FROM overlaps WHERE guild_id = ? AND other_guild_id = ?",
+                [(guild_id, other) for other in stored - set(map(str, overlaps))],
+            )
+
+            changed = conn.total_changes != before
+            if changed:
+                conn.execute(
+                    "UPDATE guilds SET version = version + 1, updated_ns = ? "
+                    "WHERE guild_id = ?",
+                    (time.time_ns(), guild_id),
+                )
+        return changed
+
+    def delete_guild(self, guild_id):
+        with self._transaction() as conn:
+            for table in ("guilds", "members", "overlaps", "history", "history_rollups"):
+                conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+
+    # ---- История
+
+    def append_history(self, guild_id, points):
+        """Добавляет точки (timestamp, member_count, online_count)"""
+        self.append_history_rows([(guild_id, t, m, o) for t, m, o in points])
+
+    def append_history_rows(self, rows):
+        """Точки нескольких серверов (guild_id, timestamp, member_count,
+        online_count) одной транзакцией — так бот пишет точки тика"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO history "
+                "(guild_id, timestamp, member_count, online_count) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def add_history_rollups(self, guild_id, step, records):
+        """Готовые агрегаты (кортежи полей history_store.ROLLUP_RECORD)"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO history_rollups (guild_id, step, bucket, count, "
+                "member_min, member_max, member_sum, online_min, online_max, online_sum) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(guild_id, step) + tuple(record) for record in records],
+            )
+
+    def history_rollups(self, guild_id, step, start=None, end=None):
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        return self._connect().execute(
+            "SELECT bucket, count, member_min, member_max, member_sum, "
+            "online_min, online_max, online_sum FROM history_rollups "
+            "WHERE guild_id = ? AND step = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+            (guild_id, step, start, end),
+        ).fetchall()
+
+    def has_history(self, guild_id):
+        return (
+            self._connect()
+            .execute("SELECT 1 FROM history WHERE guild_id = ? LIMIT 1", (guild_id,))
+            .fetchone()
+            is not None
+        )
+
+    def history_range(self, guild_id, start=None, end=None, step=None):
+        """
+        Точки истории за [start, end]. Без step — исходные точки (как
+        history_store.read_range), со step — агрегаты по интервалам step
+        секунд (как history_store.read_rollup_range)
+        """
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        conn = self._connect()
+
+        if step is None:
+            return [
+                {"timestamp": t, "member_count": m, "online_count": o}
+                for t, m, o in conn.execute(
+                    "SELECT timestamp, member_count, online_count FROM history "
+                    "WHERE guild_id = ? AND timestamp BETWEEN ? AND ? "
+                    "ORDER BY timestamp",
+                    (guild_id, start, end),
+                )
+            ]
+
+        # Сначала готовые агрегаты перенесённых периодов, дальше — запрос
+        # по точкам после последнего из них (как history_store.read_tier_range)
+        points = [
+            history_store.rollup_point(*record)
+            for record in self.history_rollups(guild_id, step, start, end)
+        ]
+        if points:
+            start = points[-1]["timestamp"] + step
+
+        rows = conn.execute(
+            "SELECT CAST(timestamp / :step AS INTEGER) * :step AS bucket, "
+            "AVG(member_count), MIN(member_count), MAX(member_count), "
+            "AVG(online_count), MIN(online_count), MAX(online_count) "
+            "FROM history WHERE guild_id = :guild_id "
+            "AND timestamp BETWEEN :start AND :end "
+            "GROUP BY bucket ORDER BY bucket",
+            {"step": step, "guild_id": guild_id, "start": start, "end": end},
+        )
+        return points + [
+            {
+                "timestamp": bucket,
+                "member_count": round(m_avg, 2),
+                "member_min": m_min,
+                "member_max": m_max,
+                "online_count": round(o_avg, 2),
+                "online_min": o_min,
+                "online_max": o_max,
+            }
+            for bucket, m_avg, m_min, m_max, o_avg, o_min, o_max in rows
+        ]
+
+    # ---- Страницы (pages_data)
+
+    def page_versions(self):
+        rows = self._connect().execute(
+            "SELECT filename, updated_ns, version FROM page_files"
+        )
+        return {filename: (updated_ns, version) for filename, updated_ns, version in rows}
+
+    def load_page_file(self, filename):
+        return [
+            json.loads(data)
+            for (data,) in self._connect().execute(
+                "SELECT data FROM pages WHERE filename = ? ORDER BY position",
+                (filename,),
+            )
+        ]
+
+    def save_page_file(self, filename, items):
+        """Сохраняет список записей файла; возвращает новую сигнатуру"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO pages (filename, position, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(filename, position) DO UPDATE SET data = excluded.data "
+                "WHERE data IS NOT excluded.data",
+                [(filename, pos, dumps(item)) for pos, item in enumerate(items)],
+            )
+            conn.execute(
+                "DELETE FROM pages WHERE filename = ? AND position >= ?",
+                (filename, len(items)),
+            )
+            updated_ns = time.time_ns()
+            conn.execute(
+                "INSERT INTO page_files (filename, updated_ns) VALUES (?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET "
+                "version = version + 1, updated_ns = excluded.updated_ns",
+                (filename, updated_ns),
+            )
+            version = conn.execute(
+                "SELECT version FROM page_files WHERE filename = ?", (filename,)
+            ).fetchone()[0]
+        return (updated_ns, version)
+
+
+class SqlitePagesSource:
+    """Источник для data_store.DataStore: файлы pages_data в таблице pages"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def scan(self):
+        return self.storage.page_versions()
+
+    def load(self, filename):
+        return self.storage.load_page_file(filename)
+
+    def save(self, filename, items):
+        return self.storage.save_page_file(filename, items)
+
+
+# ===== ИМПОРТ / ЭКСПОРТ =====
+
+
+def import_data(storage, servers_dir=SERVERS_DIR, pages_dir=PAGES_DIR):
+    """Переносит servers/*.json, servers/history/ и pages_data/*.json в базу"""
+    history_dir = os.path.join(servers_dir, "history")
+
+    for entry in sorted(os.scandir(servers_dir), key=lambda e: e.name):
+        if not entry.name.endswith(".json") or not entry.is_file():
+            continue
+        guild_id = entry.name[: -len(".json")]
+        with open(entry.path, "r", encoding="utf-8") as f:
+            document = json.load(f)
+
+        storage.save_guild(guild_id, document)
+
+        # История: бинарный файл, а если его нет — старый массив из JSON
+        points = [
+            (p["timestamp"], p["member_count"], p["online_count"])
+            for p in history_store.read_range(history_dir, guild_id)
+        ]
+
+        # Сырые точки старше 48 часов бот удаляет — от тех периодов остались
+        # только агрегаты. Переносим их записи, начавшиеся до первой точки
+        first_point = points[0][0] if points else float("inf")
+        rollups = 0
+        for name, step, _ in history_store.ROLLUP_TIERS:
+            records = [
+                r
+                for r in history_store.read_rollup_records(history_dir, guild_id, name)
+                if r[0] < first_point
+            ]
+            storage.add_history_rollups(guild_id, step, records)
+            rollups += len(records)
+
+        if not points and not rollups:
+            points = [
+                (
+                    float(p["timestamp"]),
+                    int(p.get("member_count") or 0),
+                    int(p.get("online_count") or 0),
+                )
+                for p in document.get("history") or []
+                if p.get("timestamp") is not None
+            ]
+        storage.append_history(guild_id, points)
+        print(f"Сервер {guild_id}: участников {len(document.get('members') or [])}, "
+              f"точек истории {len(points)}, агрегатов {rollups}")
+
+    for entry in sorted(os.scandir(pages_dir), key=lambda e: e.name):
+        if not entry.name.endswith(".json") or not entry.is_file():
+            continue
+        with open(entry.path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        storage.save_page_file(entry.name, items)
+        print(f"Страницы {entry.name}: записей {len(items)}")
+
+
+def export_data(storage, servers_dir=SERVERS_DIR, pages_dir=PAGES_DIR):
+    """Выгружает базу обратно в JSON-файлы и бинарную историю (для отката)"""
+    history_dir = os.path.join(servers_dir, "history")
+    os.makedirs(history_dir, exist_ok=True)
+    os.makedirs(pages_dir, exist_ok=True)
+    writer = history_store.HistoryWriter(history_dir)
+
+    for guild_id in sorted(storage.guild_versions()):
+        document = storage.load_guild(guild_id)
+        path = os.path.join(servers_dir, f"{guild_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        # История переписывается целиком, агрегаты пересчитываются
+        points = [
+            (p["timestamp"], p["member_count"], p["online_count"])
+            for p in storage.history_range(guild_id)
+        ]
+        raw_path = history_store.history_path(history_dir, guild_id)
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+        history_store.append_points(history_dir, guild_id, points)
+        writer.rebuild(guild_id)
+        # Агрегаты периодов без сырых точек — перед пересчитанными
+        rollups = 0
+        for name, step, _ in history_store.ROLLUP_TIERS:
+            records = storage.history_rollups(guild_id, step)
+            history_store.merge_rollup_records(history_dir, guild_id, name, records)
+            rollups += len(records)
+        print(f"Сервер {guild_id}: точек истории {len(points)}, агрегатов {rollups}")
+
+    for filename in sorted(storage.page_versions()):
+        items = storage.load_page_file(filename)
+        path = os.path.join(pages_dir, filename)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+        print(f"Страницы {filename}: записей {len(items)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт/экспорт SQLite-хранилища")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("--db", default=STORAGE_DB)
+    parser.add_argument("--servers", default=SERVERS_DIR)
+    parser.add_argument("--pages", default=PAGES_DIR)
+    args = parser.parse_args()
+
+    storage = Storage(args.db)
+    if args.command == "import":
+        import_data(storage, args.servers, args.pages)
+    else:
+        export_data(storage, args.servers, args.pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Трассировка тиков бота и контроль задержек event loop
+
+Операция (тик auto_update, полное пересканирование) собирает спаны —
+время фаз по серверам: перебор участников, скачивание иконок, индекс
+пересечений, сборка и запись документов. Текущая операция хранится в
+contextvars, поэтому задачи, созданные внутри неё (refresh_guild через
+gather), пишут спаны туда же, а фоновое пересканирование — в своё.
+
+После каждой операции обновляется скользящая статистика и файл статуса
+(JSON, по умолчанию cache/bot_status.json). Медленная операция
+попадает в лог с самыми долгими фазами и серверами.
+
+Отдельная задача раз в lag_interval секунд меряет опоздание своего
+пробуждения: это время, на которое синхронный код занял event loop
+(и задержал heartbeat gateway)
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Сколько последних операций держать в статистике
+WINDOW = 60
+# Сколько замеров задержки event loop держать (2 минуты при шаге 0,5 с) —
+# с запасом покрывает промежуток между записями статуса
+LAG_WINDOW = 240
+# Сколько самых долгих спанов показывать в логе и в статусе
+TOP_SPANS = 5
+# Сколько последних медленных операций хранить в статусе
+SLOW_LOG_SIZE = 10
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Спаны одной операции: фаза → время и (фаза, сервер) → время"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.phases = defaultdict(float)
+        self.spans = defaultdict(float)
+        self._lock = threading.Lock()  # запись документов идёт в потоке
+
+    def add(self, phase, guild_id, seconds):
+        with self._lock:
+            self.phases[phase] += seconds
+            if guild_id is not None:
+                self.spans[(phase, guild_id)] += seconds
+
+    def top_spans(self, count=TOP_SPANS):
+        with self._lock:
+            return sorted(self.spans.items(), key=lambda kv: -kv[1])[:count]
+
+
+@contextmanager
+def span(phase, guild_id=None):
+    """Засчитывает время блока фазе phase текущей операции (если она есть)"""
+    trace = current_trace.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(phase, guild_id, time.perf_counter() - started)
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class TickMonitor:
+    def __init__(self, status_path, slow_seconds, lag_warn_seconds, lag_interval=0.5):
+        self.status_path = status_path
+        self.slow_seconds = slow_seconds
+        self.lag_warn_seconds = lag_warn_seconds
+        self.lag_interval = lag_interval
+        self.durations = defaultdict(lambda: deque(maxlen=WINDOW))
+        self.phase_totals = defaultdict(lambda: deque(maxlen=WINDOW))
+        self.last = {}
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.lag_warnings = 0
+        self.lag_task = None
+        os.makedirs(os.path.dirname(status_path) or ".", exist_ok=True)
+
+    # ---- Операции
+
+    @contextmanager
+    def operation(self, name, slow_seconds=None):
+        """Операция с собственным набором спанов; медленной считается та,
+        что дольше slow_seconds (по умолчанию — порога монитора)"""
+        trace = Trace(name)
+        trace.slow_seconds = self.slow_seconds if slow_seconds is None else slow_seconds
+        token = current_trace.set(trace)
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+            trace.duration = time.perf_counter() - started
+            self.finish(trace)
+
+    def finish(self, trace):
+        self.durations[trace.name].append(trace.duration)
+        self.phase_totals[trace.name].append(dict(trace.phases))
+        summary = {
+            "started_at": trace.started_at,
+            "duration_ms": ms(trace.duration),
+            "phases_ms": {phase: ms(t) for phase, t in sorted(trace.phases.items())},
+            "top_spans": [
+                {"phase": phase, "guild_id": guild_id, "ms": ms(t)}
+                for (phase, guild_id), t in trace.top_spans()
+            ],
+        }
+        self.last[trace.name] = summary
+
+        if trace.duration >= trace.slow_seconds:
+            self.slow.append(dict(summary, operation=trace.name))
+            phases = ", ".join(
+                f"{phase} {t:.2f} с"
+                for phase, t in sorted(trace.phases.items(), key=lambda kv: -kv[1])[:TOP_SPANS]
+            )
+            guilds = ", ".join(
+                f"{guild_id}/{phase} {t:.2f} с" for (phase, guild_id), t in trace.top_spans()
+            )
+            print(f"Медленная операция {trace.name}: {trace.duration:.1f} с; фазы: {phases}")
+            if guilds:
+                print(f"  Самые долгие серверы: {guilds}")
+
+        self.write_status()
+
+    # ---- Задержка event loop
+
+    async def sample_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - started - self.lag_interval)
+            self.lags.append(lag)
+            if lag >= self.lag_warn_seconds:
+                self.lag_warnings += 1
+                print(f"Event loop был занят {lag:.2f} с — heartbeat gateway под угрозой")
+
+    def start_lag_sampler(self):
+        """Запускает замер задержки в текущем event loop (один раз)"""
+        if self.lag_task is None or self.lag_task.done():
+            self.lag_task = asyncio.get_running_loop().create_task(self.sample_loop_lag())
+
+    # ---- Статус
+
+    def status(self):
+        operations = {}
+        for name, durations in self.durations.items():
+            values = sorted(durations)
+            phase_avg = defaultdict(float)
+            for phases in self.phase_totals[name]:
+                for phase, t in phases.items():
+                    phase_avg[phase] += t / len(self.phase_totals[name])
+            operations[name] = {
+                "count": len(values),
+                "p50_ms": ms(statistics.median(values)),
+                "p95_ms": ms(values[min(len(values) - 1, int(len(values) * 0.95))]),
+                "max_ms": ms(values[-1]),
+                "phases_avg_ms": {phase: ms(t) for phase, t in sorted(phase_avg.items())},
+                "last": self.last.get(name),
+            }
+
+        lags = sorted(self.lags)
+        return {
+            "updated_at": time.time(),
+            "pid": os.getpid(),
+            "window": WINDOW,
+            "operations": operations,
+            "loop_lag": {
+                "samples": len(lags),
+                "last_ms": ms(self.lags[-1]) if lags else None,
+                "p95_ms": ms(lags[min(len(lags) - 1, int(len(lags) * 0.95))]) if lags else None,
+                "max_ms": ms(lags[-1]) if lags else None,
+                "warnings": self.lag_warnings,
+            },
+            "slow_operations": list(self.slow),
+        }
+
+    def write_status(self):
+        tmp_path = f"{self.status_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.status(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            print(f"Ошибка записи статуса бота: {e}")